@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# BatchScoring.py
+# Re-scores a whole directory of archives, e.g. a mirror after a retrain, with a model saved
+# by Training/ExportModel.py. The archives are read straight from the directory by parallel
+# worker processes and the model scores their packages in batches. Scores are written as
+# they come, to a CSV or, for a .parquet output path, to Parquet. Memory stays the same
+# however many archives the directory holds.
+
+import asyncio
+import csv
+import datetime
+import json
+import os
+import time
+
+from FeatureExtraction import extract_packages, line_tokens
+from ScoringService import Scorer, load_model
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None  # Only needed for Parquet output
+
+# Packages scored by the model at a time, and per row group of Parquet output
+SCORE_BATCH = 1024
+
+SCORES_HEADER = ["Archive", "PackageName", "Probability", "Flagged", "Error"]
+
+def iter_archives(directory):
+    """Yields the names of the files in `directory` as they are listed, without listing all of them first."""
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file():
+                yield entry.name
+
+class ScoreWriter:
+    """Writes rows in SCORES_HEADER order to a CSV, or to Parquet for a .parquet path, a batch at a time."""
+
+    def __init__(self, path):
+        self.parquet = path.endswith(".parquet")
+        if self.parquet:
+            if pq is None:
+                raise ImportError("Writing Parquet scores needs pyarrow")
+            schema = pa.schema([("Archive", pa.string()), ("PackageName", pa.string()),
+                                ("Probability", pa.float64()), ("Flagged", pa.string()),
+                                ("Error", pa.string())])
+            self.writer = pq.ParquetWriter(path, schema)
+        else:
+            self.file = open(path, 'w', newline='', encoding='utf-8')
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(SCORES_HEADER)
+
+    def write(self, rows):
+        if self.parquet:
+            self.writer.write_table(pa.Table.from_pylist([dict(zip(SCORES_HEADER, row)) for row in rows],
+                                                         schema=self.writer.schema))
+        else:
+            self.writer.writerows(rows)
+            self.file.flush()
+
+    def close(self):
+        (self.writer if self.parquet else self.file).close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+async def score_archives(directory, model_path, output_path, token_file, workers=None, batch_size=SCORE_BATCH,
+                         cache_dir=None, policy=None, limits=None):
+    """
+    Scores every package in the archives of `directory` with the model at `model_path` and
+    writes a row per package to `output_path` (see ScoreWriter), in directory order.
+    Archives over the archive `limits` (see DEFAULT_ARCHIVE_LIMITS) get one row with the
+    limit they went over instead of a probability, and archives that cannot be read one
+    row with the error.
+    The archives are read by `workers` processes, with a bounded number in flight (see
+    extract_packages), and the packages are scored `batch_size` at a time, so neither the
+    features nor the scores of the whole directory are held in memory. The throughput is
+    printed after every batch. Returns the number of archives, packages, flagged archives
+    and unreadable archives.
+    """
+    with open(token_file, 'r', encoding='utf-8') as f:
+        tokens = line_tokens(json.load(f))
+    scorer = Scorer(load_model(model_path), tokens, cache_dir=cache_dir, policy=policy, limits=limits)
+
+    counts = {"archives": 0, "packages": 0, "flagged": 0, "unreadable": 0}
+    start = time.perf_counter()
+    pending = []  # (archive, row or None, limit it went over, read error) in output order
+
+    def flush(writer):
+        rows = [row for _, row, _, _ in pending if row is not None]
+        probabilities = iter(scorer.probabilities(rows).tolist())
+        writer.write([[archive, None, None, flagged, error] if row is None
+                      else [archive, row[0], next(probabilities), None, None]
+                      for archive, row, flagged, error in pending])
+        counts["packages"] += len(rows)
+        pending.clear()
+        seconds = time.perf_counter() - start
+        print(f"Scored {counts['packages']} packages from {counts['archives']} archives in {seconds:.0f} s, "
+              f"{counts['packages'] / seconds:.1f} packages/s")
+
+    with ScoreWriter(output_path) as writer:
+        extracted = extract_packages(directory, iter_archives(directory), scorer.config, workers, from_archives=True)
+        try:
+            async for entry in extracted:
+                counts["archives"] += 1
+                if entry["flagged"] is not None:
+                    counts["flagged"] += 1
+                    pending.append((entry["item"], None, entry["flagged"], None))
+                if entry["error"] is not None:
+                    counts["unreadable"] += 1
+                    pending.append((entry["item"], None, None, entry["error"]))
+                pending.extend((entry["item"], result["row"], None, None) for result in entry["results"])
+                if len(pending) >= batch_size:
+                    flush(writer)
+            if pending:
+                flush(writer)
+        finally:
+            await extracted.aclose()  # Shuts the worker processes down on errors and interrupts too
+
+    print("Scores saved to", output_path)
+    return counts
+
+if __name__ == "__main__":
+    startime = datetime.datetime.now()
+    source_dir = r"C:\\Users\\Mikael Laptop\\MaliciousPackages"  # Archives to score
+    model_path = r"C:\\Users\\Mikael Laptop\\Extraction\\model.pkl"  # Saved by Training/ExportModel.py
+    token_file = r"C:\\Users\\Mikael Laptop\\Extraction\\dangerous_tokens.json"
+    output_path = r"C:\\Users\\Mikael Laptop\\Extraction\\scores.csv"  # .parquet for Parquet output (needs pyarrow)
+    workers = os.cpu_count()  # Worker processes reading the archives, 1 for a serial run
+    batch_size = SCORE_BATCH  # Packages scored by the model at a time
+    cache_dir = None  # Per-file results cache shared with FeatureExtraction.py, None to disable
+    limits = None  # Limits per archive, e.g. {"max_bytes": 1024 ** 3}; None for the defaults
+
+    counts = asyncio.run(score_archives(source_dir, model_path, output_path, token_file, workers=workers,
+                                        batch_size=batch_size, cache_dir=cache_dir, limits=limits))
+    print(f"{counts['archives']} archives, {counts['packages']} packages, {counts['flagged']} flagged, "
+          f"{counts['unreadable']} unreadable")
+    endtime = datetime.datetime.now()
+    print(f"Starttid: {startime} Sluttid: {endtime}")
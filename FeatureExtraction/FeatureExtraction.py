@@ -1,635 +1,3043 @@
-#!/usr/bin/env python3
-# extract_archives.py
-
-import os
-import zipfile
-import tarfile
-import gzip
-import shutil
-import csv
-import json
-import re
-import base64
-import statistics
-import math
-import asyncio
-import datetime
-
-# Define a tuple of file extensions
-extensions = (
-    # Python source and stubs
-    ".py", ".pyw", ".pyi",
-    # C/C++ source and header files (used in extensions)
-    ".c", ".cpp", ".cc", ".cxx",
-    ".h", ".hpp", ".hh", ".hxx",
-    # Cython source files
-    ".pyx", ".pxd",
-    # Assembly files (rare but possible)
-    ".s", ".asm",
-    # Fortran source files (common in scientific computing)
-    ".f", ".for", ".f77", ".f90", ".f95",
-    # Rust source files (for Rust-based extensions)
-    ".rs",
-    # Shell scripts (often used in build processes)
-    ".sh", ".bash", ".zsh",
-    # Web assets (if applicable)
-    ".js", ".mjs",
-    # SQL scripts (if the package includes database scripts)
-    ".sql"
-)
-
-
-
-def count_file_types(directory):
-    """
-    Counts the number of occurrences of specific file extensions in the given directory.
-
-    Returns a dictionary where keys are file extensions and values are their counts.
-    """
-    file_types = [
-        'bat', 'bz2', 'c', 'cert', 'conf', 'cpp', 'crt', 'css', 'csv', 'deb', 'erb', 'gemspec', 'gif', 'gz', 'h', 'html',
-        'ico', 'ini', 'jar', 'java', 'jpg', 'js', 'json', 'key', 'm4v', 'markdown', 'md', 'pdf', 'pem', 'png', 'ps', 'py',
-        'rb', 'rpm', 'rst', 'sh', 'svg', 'toml', 'ttf', 'txt', 'xml', 'yaml', 'yml', 'eot', 'exe', 'jpeg', 'properties',
-        'sql', 'swf', 'tar', 'woff', 'woff2', 'aac', 'bmp', 'cfg', 'dcm', 'dll', 'doc', 'flac', 'flv', 'ipynb', 'm4a',
-        'mid', 'mkv', 'mp3', 'mp4', 'mpg', 'ogg', 'otf', 'pickle', 'pkl', 'psd', 'pxd', 'pxi', 'pyc', 'pyx', 'r', 'rtf',
-        'so', 'sqlite', 'tif', 'tp', 'wav', 'webp', 'whl', 'xcf', 'xz', 'zip', 'mov', 'wasm', 'webm'
-    ]
-
-    
-
-    file_counts = {ext: 0 for ext in file_types}  # Initialize all file type counts to 0
-
-    for dirpath, _, subfiles in os.walk(directory):
-        for fname in subfiles:
-            ext = fname.split('.')[-1].lower()  # Get file extension
-            if ext in file_counts:
-                file_counts[ext] += 1
-
-    return file_counts
-
-
-# Generalization function: transforms identifiers and strings
-def generalize_text(text):
-
-    return ''.join('a' if c.isalpha() else '1' if c.isdigit() else c for c in text)
-
-# Function to compute homogeneous and heterogeneous identifiers and strings
-def compute_homogeneous_heterogeneous(directory):
-    """
-    Computes counts for homogeneous and heterogeneous identifiers and strings
-    for the entire package and separately for the setup.py file.
-    """
-    # Package-wide counts
-    homogeneous_identifiers = 0
-    heterogeneous_identifiers = 0
-    homogeneous_strings = 0
-    heterogeneous_strings = 0
-
-    # Setup.py-specific counts
-    setup_homogeneous_identifiers = 0
-    setup_heterogeneous_identifiers = 0
-    setup_homogeneous_strings = 0
-    setup_heterogeneous_strings = 0
-
-    # Regex patterns
-    identifier_pattern = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')  # Matches Python-like identifiers
-    string_pattern = re.compile(r'["\'](.*?)["\']')  # Matches anything inside quotes
-
-
-
-    # Process all files
-    for dirpath, _, subfiles in os.walk(directory):
-        for fname in subfiles:
-            fpath = os.path.join(dirpath, fname)
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-
-                    # Process identifiers
-                    identifiers = identifier_pattern.findall(content)
-                    for identifier in identifiers:
-                        transformed = generalize_text(identifier)
-                        unique_chars = set(transformed)
-                        if len(unique_chars) == 1:
-                            homogeneous_identifiers += 1
-                        else:
-                            heterogeneous_identifiers += 1
-
-                    # Process strings
-                    strings = string_pattern.findall(content)
-                    for string in strings:
-                        transformed = generalize_text(string)
-                        unique_chars = set(transformed)
-                        if len(unique_chars) == 1:
-                            homogeneous_strings += 1
-                        else:
-                            heterogeneous_strings += 1
-
-                    # If processing setup.py, store separate counts
-                    if os.path.basename(fpath) in {"setup.py", "__init__.py", "__init__.pyi", "__init__"}:
-                        for identifier in identifiers:
-                            transformed = generalize_text(identifier)
-                            unique_chars = set(transformed)
-                            if len(unique_chars) == 1:
-                                setup_homogeneous_identifiers += 1
-                            else:
-                                setup_heterogeneous_identifiers += 1
-
-                        for string in strings:
-                            transformed = generalize_text(string)
-                            unique_chars = set(transformed)
-                            if len(unique_chars) == 1:
-                                setup_homogeneous_strings += 1
-                            else:
-                                setup_heterogeneous_strings += 1
-
-            except (OSError, UnicodeDecodeError):
-                pass  # Ignore unreadable files
-
-    return {
-        # Package-wide stats
-        "homogeneous_identifiers": homogeneous_identifiers,
-        "heterogeneous_identifiers": heterogeneous_identifiers,
-        "homogeneous_strings": homogeneous_strings,
-        "heterogeneous_strings": heterogeneous_strings,
-
-        # Setup.py-specific stats
-        "setup_homogeneous_identifiers": setup_homogeneous_identifiers,
-        "setup_heterogeneous_identifiers": setup_heterogeneous_identifiers,
-        "setup_homogeneous_strings": setup_homogeneous_strings,
-        "setup_heterogeneous_strings": setup_heterogeneous_strings,
-    }
-
-
-# Function to compute Shannon entropy for a given text
-def entropy(text):
-    """Computes Shannon entropy of a given text."""
-    if not text:
-        return 0  # Avoid division by zero
-
-    freq = {}
-    for char in text:
-        freq[char] = freq.get(char, 0) + 1
-
-    entropy = 0
-    text_length = len(text)
-
-    for count in freq.values():
-        probability = count / text_length
-        entropy -= probability * math.log2(probability)
-
-    return entropy
-
-# Function to compute entropy statistics separately for identifiers and strings
-def compute_entropy_by_category(directory):
-    """
-    Computes entropy statistics separately for identifiers and strings in the entire package
-    and separately for setup.py if present.
-    """
-    # Entropy lists for the full package
-    identifier_entropies = []
-    string_entropies = []
-
-    # Entropy lists for setup.py only
-    setup_identifier_entropies = []
-    setup_string_entropies = []
-
-    # Regular expressions
-    identifier_pattern = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')  # Matches Python identifiers
-    string_pattern = re.compile(r'["\'](.*?)["\']')  # Matches anything inside quotes
-
-
-    # Process all files
-    for dirpath, _, subfiles in os.walk(directory):
-        for fname in subfiles:
-            fpath = os.path.join(dirpath, fname)
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-
-                    # Extract identifiers and compute their entropy
-                    identifiers = identifier_pattern.findall(content)
-                    for identifier in identifiers:
-                        entropy_value = entropy(identifier)
-                        identifier_entropies.append(entropy_value)
-
-                        # If processing setup.py, store separate entropy values
-                        if os.path.basename(fpath) in {"setup.py", "__init__.py", "__init__.pyi", "__init__"}:
-                            setup_identifier_entropies.append(entropy_value)
-
-                    # Extract strings and compute their entropy
-                    strings = string_pattern.findall(content)
-                    for string in strings:
-                        entropy_value = entropy(string)
-                        string_entropies.append(entropy_value)
-
-                        # If processing setup.py, store separate entropy values
-                    if os.path.basename(fpath) in {"setup.py", "__init__.py", "__init__.pyi", "__init__"}:
-                            setup_string_entropies.append(entropy_value)
-
-            except (OSError, UnicodeDecodeError):
-                pass  # Ignore unreadable files
-
-    return {
-        # Full package entropy stats
-        "identifier_entropy_mean": statistics.mean(identifier_entropies) if identifier_entropies else 0,
-        "identifier_entropy_std_dev": statistics.stdev(identifier_entropies) if len(identifier_entropies) > 1 else 0,
-        "identifier_entropy_max": max(identifier_entropies) if identifier_entropies else 0,
-        "identifier_entropy_q3": statistics.quantiles(identifier_entropies, n=4)[2] if len(identifier_entropies) >= 4 else max(identifier_entropies) if identifier_entropies else 0,
-
-        "string_entropy_mean": statistics.mean(string_entropies) if string_entropies else 0,
-        "string_entropy_std_dev": statistics.stdev(string_entropies) if len(string_entropies) > 1 else 0,
-        "string_entropy_max": max(string_entropies) if string_entropies else 0,
-        "string_entropy_q3": statistics.quantiles(string_entropies, n=4)[2] if len(string_entropies) >= 4 else max(string_entropies) if string_entropies else 0,
-
-        # Setup.py-specific entropy stats
-        "setup_identifier_entropy_mean": statistics.mean(setup_identifier_entropies) if setup_identifier_entropies else 0,
-        "setup_identifier_entropy_std_dev": statistics.stdev(setup_identifier_entropies) if len(setup_identifier_entropies) > 1 else 0,
-        "setup_identifier_entropy_max": max(setup_identifier_entropies) if setup_identifier_entropies else 0,
-        "setup_identifier_entropy_q3": statistics.quantiles(setup_identifier_entropies, n=4)[2] if len(setup_identifier_entropies) >= 4 else max(setup_identifier_entropies) if setup_identifier_entropies else 0,
-
-        "setup_string_entropy_mean": statistics.mean(setup_string_entropies) if setup_string_entropies else 0,
-        "setup_string_entropy_std_dev": statistics.stdev(setup_string_entropies) if len(setup_string_entropies) > 1 else 0,
-        "setup_string_entropy_max": max(setup_string_entropies) if setup_string_entropies else 0,
-        "setup_string_entropy_q3": statistics.quantiles(setup_string_entropies, n=4)[2] if len(setup_string_entropies) >= 4 else max(setup_string_entropies) if setup_string_entropies else 0,
-    }
-
-
-# Function to count specific symbols in all files of a package
-def count_symbols_in_package(directory):
-    bracket_counts = []  # Stores counts of [] in each file
-    equal_counts = []  # Stores counts of = in each file
-    plus_counts = []  # Stores counts of + in each file
-    
-    for dirpath, _, subfiles in os.walk(directory):
-        for fname in subfiles:
-            fpath = os.path.join(dirpath, fname)
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    bracket_counts.append(content.count('[') + content.count(']'))
-                    equal_counts.append(content.count('='))
-                    plus_counts.append(content.count('+'))
-            except (OSError, UnicodeDecodeError):
-                pass
-    
-    # Function to compute statistics for a list of counts
-    def compute_stats(counts):
-        if not counts:
-            return 0, 0, 0, 0  # Default values if no data
-        return (
-            statistics.mean(counts),
-            statistics.stdev(counts) if len(counts) > 1 else 0,
-            max(counts),
-            statistics.quantiles(counts, n=4)[2] if len(counts) >= 4 else max(counts)  # Q3
-        )
-    
-    return {
-        "bracket_mean": compute_stats(bracket_counts)[0],
-        "bracket_std_dev": compute_stats(bracket_counts)[1],
-        "bracket_max": compute_stats(bracket_counts)[2],
-        "bracket_q3": compute_stats(bracket_counts)[3],
-
-        "equal_mean": compute_stats(equal_counts)[0],
-        "equal_std_dev": compute_stats(equal_counts)[1],
-        "equal_max": compute_stats(equal_counts)[2],
-        "equal_q3": compute_stats(equal_counts)[3],
-
-        "plus_mean": compute_stats(plus_counts)[0],
-        "plus_std_dev": compute_stats(plus_counts)[1],
-        "plus_max": compute_stats(plus_counts)[2],
-        "plus_q3": compute_stats(plus_counts)[3],
-    }
-
-
-def extract_archives(directory, destination=None):
-    """
-    Extract .zip, .tar, and .gz archives found in `directory`.
-    Extracts into `destination` if provided; otherwise, extracts into `directory`.
-    Uses the password "infected" for password-protected zip files.
-    """
-    if destination is None:
-        destination = directory
-    os.makedirs(destination, exist_ok=True)
-
-    for filename in os.listdir(directory):
-        filepath = os.path.join(directory, filename)
-        if os.path.isdir(filepath):
-            continue
-        # Check if it's a .zip
-        if zipfile.is_zipfile(filepath):
-            with zipfile.ZipFile(filepath, 'r') as z:
-                try:
-                    z.setpassword(b'infected')
-                    z.extractall(destination)
-                except RuntimeError as e:
-                    print(f"[ZIP] Could not extract {filename} with password 'infected': {e}")
-                else:
-                    print(f"[ZIP] Extracted: {filename} -> {destination}")
-        # Check if it's a .tar
-        elif tarfile.is_tarfile(filepath):
-            try:
-                with tarfile.open(filepath, 'r:*') as t:
-                    t.extractall(destination, filter=lambda ti, tar: ti if (not os.path.isabs(ti.name) and ".." not in ti.name.split(os.path.sep)) else None)
-                print(f"[TAR] Extracted: {filename} -> {destination}")
-            except (tarfile.TarError, OSError) as e:
-                print(f"[TAR] Could not extract {filename}: {e}")
-        # Check if it's a single-file .gz
-        elif filename.endswith('.gz'):
-            out_filepath = os.path.join(destination, filename[:-3])
-            try:
-                with gzip.open(filepath, 'rb') as f_in, open(out_filepath, 'wb') as f_out:
-                    shutil.copyfileobj(f_in, f_out)
-                print(f"[GZ] Extracted: {filename} -> {out_filepath}")
-            except OSError as e:
-                print(f"[GZ] Could not extract {filename}: {e}")
-
-
-
-
-def is_base64_encoded(s):
-    try:
-        decoded = base64.b64decode(s, validate=True)
-        return base64.b64encode(decoded).decode('utf-8') == s
-    except Exception:
-        return False
-
-def get_total_ip(root_dir):
-    total_ips = 0
-    setup_ips = 0
-    ip_pattern = re.compile(r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b')
-
-    for dirpath, subdirs, subfiles in os.walk(root_dir):
-        for fname in subfiles:
-            fpath = os.path.join(dirpath, fname)
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                    for line in f:
-                        total_ips += len(ip_pattern.findall(line))
-
-                        # If processing setup.py, store separate counts
-                        if os.path.basename(fpath) in {"setup.py", "__init__.py", "__init__.pyi", "__init__"}:
-                            setup_ips += len(ip_pattern.findall(line))
-
-            except (OSError, UnicodeDecodeError):
-                pass
-
-    return (
-        total_ips, setup_ips
-    )
-
-import re
-
-def get_total_base64(root_dir):
-    setup_base64 = 0
-    total_base64 = 0
-
-    string_pattern = re.compile(r'["\'](.*?)["\']')  # match content inside quotes
-
-    for dirpath, _, subfiles in os.walk(root_dir):
-        for fname in subfiles:
-            fpath = os.path.join(dirpath, fname)
-
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    strings = string_pattern.findall(content)
-
-                    for s in strings:
-                        if is_base64_encoded(s.strip()):
-                            total_base64 += 1
-                            if os.path.basename(fpath) in {"setup.py", "__init__.py", "__init__.pyi", "__init__"}:
-                                setup_base64 += 1
-
-            except (OSError, UnicodeDecodeError):
-                pass
-
-    return total_base64, setup_base64
-
-
-def get_total_url(root_dir):
-    total_urls = 0
-    setup_urls = 0
-    url_pattern = re.compile(r'https?://\S+')
-    
-    for dirpath, subdirs, subfiles in os.walk(root_dir):
-        for fname in subfiles:
-            fpath = os.path.join(dirpath, fname)
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                    for line in f:
-                        total_urls += len(url_pattern.findall(line))
-
-
-
-                        # If processing setup.py, store separate counts
-                        if os.path.basename(fpath) in {"setup.py", "__init__.py", "__init__.pyi", "__init__"}:
-                            setup_urls += len(url_pattern.findall(line))
-
-            except (OSError, UnicodeDecodeError):
-                pass
-
-    return (
-        total_urls, setup_urls
-    )
-
-def get_total_tokens(root_dir, tokens):
-    total_tokens = 0
-    setup_tokens = 0
-
-    for dirpath, subdirs, subfiles in os.walk(root_dir):
-        for fname in subfiles:
-            fpath = os.path.join(dirpath, fname)
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                    for line in f:
-                        total_tokens += sum(line.count(token) for token in tokens)
-
-                        # If processing setup.py, store separate counts
-                        if os.path.basename(fpath) in {"setup.py", "__init__.py", "__init__.pyi", "__init__"}:
-                            setup_tokens += sum(line.count(token) for token in tokens)
-
-            except (OSError, UnicodeDecodeError):
-                pass
-
-    return (
-         total_tokens, setup_tokens
-    )
-
- 
-
-def get_total_lines(root_dir):
-    total_lines = 0
-    total_words = 0
-    setup_lines = 0
-    setup_words = 0
-    for dirpath, subdirs, subfiles in os.walk(root_dir):
-        for fname in subfiles:
-            fpath = os.path.join(dirpath, fname)
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                    for line in f:
-                        line_words = line.split()
-                        total_lines += 1
-                        total_words += len(line_words)
-
-                        # If processing setup.py, store separate counts
-                        if os.path.basename(fpath) in {"setup.py", "__init__.py", "__init__.pyi", "__init__"}:
-                            setup_lines += 1
-                            setup_words += len(line_words)
-
-            except (OSError, UnicodeDecodeError):
-                pass
-
-    return (
-        total_lines, total_words, setup_lines, setup_words
-    )
-
-def get_total_install_script_patterns(root_dir):
-
-    pattern = re.compile(
-        r'\b(?:'
-        r'exec\s*\(\s*open\s*\('
-        r'|subprocess\.run\s*\('
-        r'|subprocess\.call\s*\('
-        r'|\[\s*[\'"]pip[\'"]\s*,\s*[\'"]install[\'"]'
-        r'|\[\s*[\'"]pip[\'"]\s*,\s*[\'"]download[\'"]'
-        r'|python\s+setup\.py\s+install'
-        r'|\[\s*[\'"]python[\'"]\s*,\s*[\'"]setup\.py[\'"]\s*,\s*[\'"]install[\'"]'
-        r'|entry_points\s*='
-        r'|scripts\s*='
-        r')\b',
-        re.IGNORECASE
-    )
-    total = 0
-    for dirpath, _, files in os.walk(root_dir):
-        for fname in files:
-            if not fname.endswith(".py"):
-                continue
-            fpath = os.path.join(dirpath, fname)
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    matches = pattern.findall(content)
-                    total += len(matches)
-            except (OSError, UnicodeDecodeError):
-                pass
-    return total
-
-dangerous_pattern = re.compile(
-    r'\b(?:chmod\s+\+x|rm\s+-rf\s+/|apt-get\s+install|yum\s+install|brew\s+install|Makefile\s+install:|sudo\s+make\s+install|wget\s+http://|socat\s+exec:)\b',
-    re.IGNORECASE
-)
-
-def get_total_dangerous_install_commands(root_dir):
-    total = 0
-    for dirpath, _, files in os.walk(root_dir):
-        for fname in files:
-            fpath = os.path.join(dirpath, fname)
-            try:
-                with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
-                    content = f.read()
-                    matches = dangerous_pattern.findall(content)
-                    total += len(matches)
-            except (OSError, UnicodeDecodeError):
-                continue
-    return total
-
-async def record_setup_info_to_csv(directory, csv_path, token_file):
-    """
-    Gathers statistics for each package (top-level directory) inside 'directory'
-    by aggregating data over the entire directory tree. For each package, a single row
-    is written to the CSV with metrics such as total lines, total words, etc.
-    """
-    with open(token_file, 'r', encoding='utf-8') as f:
-        tokens = json.load(f)
-        
-    results = []
-    # Loop over each top-level directory (each unzipped package)
-    for pkg in os.listdir(directory):
-        pkg_path = os.path.join(directory, pkg)
-        if not os.path.isdir(pkg_path):
-            continue
-        
-
-        total_counts, total_ip, total_url, total_base64, total_tokens, symbol_stats, entropy_stats, homogeneity_stats, file_type_counts, total_install_patterns, total_dangerous  = await asyncio.gather(
-            asyncio.to_thread(get_total_lines, pkg_path),
-            asyncio.to_thread(get_total_ip, pkg_path),
-            asyncio.to_thread(get_total_url, pkg_path),
-            asyncio.to_thread(get_total_base64, pkg_path),
-            asyncio.to_thread(get_total_tokens, pkg_path, tokens),
-            asyncio.to_thread(count_symbols_in_package, pkg_path),
-            asyncio.to_thread(compute_entropy_by_category, pkg_path),
-            asyncio.to_thread(compute_homogeneous_heterogeneous, pkg_path),
-            asyncio.to_thread(count_file_types, pkg_path),
-            asyncio.to_thread(get_total_install_script_patterns, pkg_path),
-            asyncio.to_thread(get_total_dangerous_install_commands, pkg_path)
-        )
-        total_tokens, setup_tokens = total_tokens
-        total_base64, setup_base64 = total_base64
-        total_urls, setup_urls = total_url
-        total_ips, setup_ips = total_ip
-        total_lines, total_words, setup_lines, setup_words = total_counts
-        #Aggregate statistics for the entire package directory
-        #total_lines, total_words, total_tokens, total_urls, total_base64, total_ips, \
-        #setup_lines, setup_words, setup_tokens, setup_urls, setup_base64, setup_ips = get_total_count(pkg_path)
-        
-        #symbol_stats = count_symbols_in_package(pkg_path)
-        #entropy_stats = compute_entropy_by_category(pkg_path)
-        #homogeneity_stats = compute_homogeneous_heterogeneous(pkg_path)
-        #file_type_counts = count_file_types(pkg_path)
-        
-        results.append([
-            pkg,
-            total_lines, total_words, total_tokens, total_urls, total_base64, total_ips,
-            symbol_stats["bracket_mean"], symbol_stats["bracket_std_dev"], symbol_stats["bracket_max"], symbol_stats["bracket_q3"],
-            symbol_stats["equal_mean"], symbol_stats["equal_std_dev"], symbol_stats["equal_max"], symbol_stats["equal_q3"],
-            symbol_stats["plus_mean"], symbol_stats["plus_std_dev"], symbol_stats["plus_max"], symbol_stats["plus_q3"],
-            entropy_stats["identifier_entropy_mean"], entropy_stats["identifier_entropy_std_dev"], entropy_stats["identifier_entropy_max"], entropy_stats["identifier_entropy_q3"],
-            entropy_stats["string_entropy_mean"], entropy_stats["string_entropy_std_dev"], entropy_stats["string_entropy_max"], entropy_stats["string_entropy_q3"],
-            homogeneity_stats["homogeneous_identifiers"], homogeneity_stats["heterogeneous_identifiers"],
-            homogeneity_stats["homogeneous_strings"], homogeneity_stats["heterogeneous_strings"],
-            setup_lines, setup_words, setup_tokens, setup_urls, setup_base64, setup_ips,
-            entropy_stats["setup_identifier_entropy_mean"], entropy_stats["setup_identifier_entropy_std_dev"],
-            entropy_stats["setup_identifier_entropy_max"], entropy_stats["setup_identifier_entropy_q3"],
-            entropy_stats["setup_string_entropy_mean"], entropy_stats["setup_string_entropy_std_dev"],
-            entropy_stats["setup_string_entropy_max"], entropy_stats["setup_string_entropy_q3"],
-            homogeneity_stats["setup_homogeneous_identifiers"], homogeneity_stats["setup_heterogeneous_identifiers"],
-            homogeneity_stats["setup_homogeneous_strings"], homogeneity_stats["setup_heterogeneous_strings"], total_install_patterns, total_dangerous
-        ] + list(file_type_counts.values()))
-        
-        print("Processed", pkg)
-        
-    with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow([
-            "PackageName", "Total Lines", "Total Words", "Total Tokens", "Total URLs", "Total Base64", "Total IPs",
-            "Bracket Mean", "Bracket Std Dev", "Bracket Max", "Bracket Q3",
-            "Equal Mean", "Equal Std Dev", "Equal Max", "Equal Q3",
-            "Plus Mean", "Plus Std Dev", "Plus Max", "Plus Q3",
-            "Identifier Entropy Mean", "Identifier Entropy Std Dev", "Identifier Entropy Max", "Identifier Entropy Q3",
-            "String Entropy Mean", "String Entropy Std Dev", "String Entropy Max", "String Entropy Q3",
-            "Homogeneous Identifiers", "Heterogeneous Identifiers", "Homogeneous Strings", "Heterogeneous Strings",
-            "Setup Total Lines", "Setup Total Words", "Setup Total Tokens", "Setup Total URLs", "Setup Total Base64", "Setup Total IPs",
-            "Setup Identifier Entropy Mean", "Setup Identifier Entropy Std Dev", "Setup Identifier Entropy Max", "Setup Identifier Entropy Q3",
-            "Setup String Entropy Mean", "Setup String Entropy Std Dev", "Setup String Entropy Max", "Setup String Entropy Q3",
-            "Setup Homogeneous Identifiers", "Setup Heterogeneous Identifiers", "Setup Homogeneous Strings", "Setup Heterogeneous Strings", "Total Install Script in .py", "Total Dangerous Install Commands Count"
-        ] + [ext.upper() + " Count" for ext in file_type_counts.keys()])
-        
-        for row in results:
-            writer.writerow(row)
-            
-    print("Results saved to", csv_path)
-
-if __name__ == "__main__":
-    startime = datetime.datetime.now()
-    source_dir = r"C:\\Users\\Mikael Laptop\\MaliciousPackages"
-    output_dir = r"C:\\Users\\Mikael Laptop\\Extraction\\ExtractedMaliciousPackages"
-    token_file = r"C:\\Users\\Mikael Laptop\\Extraction\\dangerous_tokens.json"
-    csv_output_path = os.path.join(output_dir, "dataset.csv")
-    extract_archives(source_dir, output_dir)
-
-    asyncio.run(record_setup_info_to_csv(output_dir, csv_output_path, token_file))
-    endtime = datetime.datetime.now()
-    print(f"Starttid: {startime} Sluttid: {endtime}")
-
+#!/usr/bin/env python3
+# extract_archives.py
+
+import os
+import zipfile
+import tarfile
+import gzip
+import shutil
+import tempfile
+import csv
+import json
+import re
+import base64
+import math
+import asyncio
+import contextlib
+import datetime
+import functools
+import hashlib
+import heapq
+import mmap
+import time
+import tracemalloc
+import zlib
+from collections import Counter, deque
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from fractions import Fraction
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None  # Only needed for the per-file table
+
+# Define a tuple of file extensions
+extensions = (
+    # Python source and stubs
+    ".py", ".pyw", ".pyi",
+    # C/C++ source and header files (used in extensions)
+    ".c", ".cpp", ".cc", ".cxx",
+    ".h", ".hpp", ".hh", ".hxx",
+    # Cython source files
+    ".pyx", ".pxd",
+    # Assembly files (rare but possible)
+    ".s", ".asm",
+    # Fortran source files (common in scientific computing)
+    ".f", ".for", ".f77", ".f90", ".f95",
+    # Rust source files (for Rust-based extensions)
+    ".rs",
+    # Shell scripts (often used in build processes)
+    ".sh", ".bash", ".zsh",
+    # Web assets (if applicable)
+    ".js", ".mjs",
+    # SQL scripts (if the package includes database scripts)
+    ".sql"
+)
+
+# Files whose metrics are also reported in the "Setup ..." columns
+SETUP_FILES = {"setup.py", "__init__.py", "__init__.pyi", "__init__"}
+
+# File extensions counted into the "<EXT> Count" columns
+FILE_TYPES = [
+    'bat', 'bz2', 'c', 'cert', 'conf', 'cpp', 'crt', 'css', 'csv', 'deb', 'erb', 'gemspec', 'gif', 'gz', 'h', 'html',
+    'ico', 'ini', 'jar', 'java', 'jpg', 'js', 'json', 'key', 'm4v', 'markdown', 'md', 'pdf', 'pem', 'png', 'ps', 'py',
+    'rb', 'rpm', 'rst', 'sh', 'svg', 'toml', 'ttf', 'txt', 'xml', 'yaml', 'yml', 'eot', 'exe', 'jpeg', 'properties',
+    'sql', 'swf', 'tar', 'woff', 'woff2', 'aac', 'bmp', 'cfg', 'dcm', 'dll', 'doc', 'flac', 'flv', 'ipynb', 'm4a',
+    'mid', 'mkv', 'mp3', 'mp4', 'mpg', 'ogg', 'otf', 'pickle', 'pkl', 'psd', 'pxd', 'pxi', 'pyc', 'pyx', 'r', 'rtf',
+    'so', 'sqlite', 'tif', 'tp', 'wav', 'webp', 'whl', 'xcf', 'xz', 'zip', 'mov', 'wasm', 'webm'
+]
+
+# Regex patterns shared by the extractors
+identifier_pattern = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')  # Matches Python-like identifiers
+string_pattern = re.compile(r'["\'](.*?)["\']')  # Matches anything inside quotes
+ip_pattern = re.compile(r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b')
+url_pattern = re.compile(r'https?://\S+')
+install_pattern = re.compile(
+    r'\b(?:'
+    r'exec\s*\(\s*open\s*\('
+    r'|subprocess\.run\s*\('
+    r'|subprocess\.call\s*\('
+    r'|\[\s*[\'"]pip[\'"]\s*,\s*[\'"]install[\'"]'
+    r'|\[\s*[\'"]pip[\'"]\s*,\s*[\'"]download[\'"]'
+    r'|python\s+setup\.py\s+install'
+    r'|\[\s*[\'"]python[\'"]\s*,\s*[\'"]setup\.py[\'"]\s*,\s*[\'"]install[\'"]'
+    r'|entry_points\s*='
+    r'|scripts\s*='
+    r')\b',
+    re.IGNORECASE
+)
+dangerous_pattern = re.compile(
+    r'\b(?:chmod\s+\+x|rm\s+-rf\s+/|apt-get\s+install|yum\s+install|brew\s+install|Makefile\s+install:|sudo\s+make\s+install|wget\s+http://|socat\s+exec:)\b',
+    re.IGNORECASE
+)
+
+
+def build_fused_pattern(patterns, first_chars):
+    """
+    Combines (name, compiled pattern) pairs into one pattern that finds every position where
+    any of them matches in a single pass. A match consumes only the first character, which
+    must be in the character class `first_chars` (so the regex engine can skip straight to
+    candidates), then looks back at it to try each pattern from there; the named group that
+    matched tells which pattern it was and where its match ends. No two of the patterns may
+    be able to match at the same position. See iter_fused_matches.
+    """
+    is_bytes = isinstance(patterns[0][1].pattern, bytes)
+    parts = []
+    for name, pattern in patterns:
+        source = pattern.pattern.decode('ascii') if is_bytes else pattern.pattern
+        if pattern.flags & re.IGNORECASE:
+            source = f"(?i:{source})"
+        parts.append(f"(?<=(?=(?P<{name}>{source}))(?s:.))")
+    source = f"[{first_chars}](?:{'|'.join(parts)})"
+    return re.compile(source.encode('ascii') if is_bytes else source)
+
+# Patterns scanned together by scan_patterns. Strings start with a quote, URLs with h, IPs
+# with a digit, and the install and dangerous alternatives with distinct words, so no two
+# of them match at the same position.
+FUSED_PATTERNS = (("string", string_pattern), ("url", url_pattern), ("ip", ip_pattern),
+                  ("install", install_pattern), ("dangerous", dangerous_pattern))
+# Every character one of them can start with; \u017f (long s) matches s when ignoring case
+FUSED_FIRST_CHARS = "\"'0-9h\\[ecsrpaybmwECSRPAYBMW\u017f"
+fused_pattern = build_fused_pattern(FUSED_PATTERNS, FUSED_FIRST_CHARS)
+
+def decode_text(raw):
+    """
+    Decodes raw file bytes exactly like open(path, 'r', encoding='utf-8', errors='ignore'),
+    including the universal newline translation of '\\r\\n' and '\\r' to '\\n'.
+    """
+    text = str(raw, 'utf-8', 'ignore')  # Also accepts memory maps
+    if '\r' in text:
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    return text
+
+
+def read_text(fpath):
+    """Reads and decodes a single file. Raises OSError if the file cannot be read."""
+    with open(fpath, 'rb') as f:
+        return decode_text(f.read())
+
+
+def iter_package_files(directory):
+    """
+    Walks `directory` once and yields (file name, decoded content) for every readable file,
+    in the order of package_files.
+    """
+    for _, fname, fpath in package_files(directory):
+        try:
+            content = read_text(fpath)
+        except OSError:
+            continue  # Ignore unreadable files
+        yield fname, content
+
+
+def count_file_types(directory):
+    """
+    Counts the number of occurrences of specific file extensions in the given directory.
+
+    Returns a dictionary where keys are file extensions and values are their counts.
+    """
+    file_counts = {ext: 0 for ext in FILE_TYPES}  # Initialize all file type counts to 0
+
+    for dirpath, _, subfiles in os.walk(directory):
+        for fname in subfiles:
+            ext = fname.split('.')[-1].lower()  # Get file extension
+            if ext in file_counts:
+                file_counts[ext] += 1
+
+    return file_counts
+
+
+# Generalization function: transforms identifiers and strings
+def generalize_text(text):
+
+    return ''.join('a' if c.isalpha() else '1' if c.isdigit() else c for c in text)
+
+# Only texts up to this many characters are memoized. The memos keep every text as a key,
+# and longer ones, such as the strings of minified bundles, hardly ever come back.
+MEMO_MAX_CHARS = 64
+
+# Bounded memo of homogeneity results; the same identifiers and strings keep coming back
+HOMOGENEOUS_CACHE_SIZE = 65536
+
+def _homogeneous(item):
+    return bool(item) and (item.isalpha() or item.isdigit() or item.count(item[0]) == len(item))
+
+_memoized_homogeneous = functools.lru_cache(maxsize=HOMOGENEOUS_CACHE_SIZE)(_homogeneous)
+
+def is_homogeneous(item):
+    """
+    Tells whether generalize_text(item) is a single repeated character, without building
+    it: the item is all letters, all digits, or one other character repeated.
+    """
+    return _memoized_homogeneous(item) if len(item) <= MEMO_MAX_CHARS else _homogeneous(item)
+
+# Function to count homogeneous and heterogeneous items in a list of identifiers or strings
+def count_homogeneous(items):
+    """Returns (homogeneous, heterogeneous) counts for the given identifiers or strings."""
+    homogeneous = sum(map(is_homogeneous, items))
+    return homogeneous, len(items) - homogeneous
+
+# Function to compute homogeneous and heterogeneous identifiers and strings
+def compute_homogeneous_heterogeneous(directory):
+    """
+    Computes counts for homogeneous and heterogeneous identifiers and strings
+    for the entire package and separately for the setup.py file.
+    """
+    stats = {
+        # Package-wide stats
+        "homogeneous_identifiers": 0,
+        "heterogeneous_identifiers": 0,
+        "homogeneous_strings": 0,
+        "heterogeneous_strings": 0,
+
+        # Setup.py-specific stats
+        "setup_homogeneous_identifiers": 0,
+        "setup_heterogeneous_identifiers": 0,
+        "setup_homogeneous_strings": 0,
+        "setup_heterogeneous_strings": 0,
+    }
+
+    for fname, content in iter_package_files(directory):
+        homogeneous_identifiers, heterogeneous_identifiers = count_homogeneous(identifier_pattern.findall(content))
+        homogeneous_strings, heterogeneous_strings = count_homogeneous(string_pattern.findall(content))
+
+        prefixes = ("", "setup_") if fname in SETUP_FILES else ("",)
+        for prefix in prefixes:
+            stats[prefix + "homogeneous_identifiers"] += homogeneous_identifiers
+            stats[prefix + "heterogeneous_identifiers"] += heterogeneous_identifiers
+            stats[prefix + "homogeneous_strings"] += homogeneous_strings
+            stats[prefix + "heterogeneous_strings"] += heterogeneous_strings
+
+    return stats
+
+
+# Function to compute Shannon entropy for a given text
+def entropy(text):
+    """Computes Shannon entropy of a given text."""
+    if not text:
+        return 0  # Avoid division by zero
+
+    freq = {}
+    for char in text:
+        freq[char] = freq.get(char, 0) + 1
+
+    entropy = 0
+    text_length = len(text)
+
+    for count in freq.values():
+        probability = count / text_length
+        entropy -= probability * math.log2(probability)
+
+    return entropy
+
+# Bounded memo of entropy values (of texts up to MEMO_MAX_CHARS); identifiers such as self
+# or return repeat constantly
+ENTROPY_CACHE_SIZE = 200000
+_entropy_cache = {}
+
+# Texts and characters per NumPy batch. The index arrays take 16 bytes per character, so
+# batches are cut by characters too, and longer texts are counted a slice at a time.
+ENTROPY_BATCH_SIZE = 4096
+ENTROPY_BATCH_CHARS = 1024 * 1024
+
+def _entropy_batches(texts):
+    """Yields consecutive runs of `texts` of up to ENTROPY_BATCH_SIZE texts and ENTROPY_BATCH_CHARS characters."""
+    batch = []
+    chars = 0
+    for text in texts:
+        if batch and (len(batch) >= ENTROPY_BATCH_SIZE or chars + len(text) > ENTROPY_BATCH_CHARS):
+            yield batch
+            batch = []
+            chars = 0
+        batch.append(text)
+        chars += len(text)
+    if batch:
+        yield batch
+
+def _histogram_entropies(counts, lengths):
+    """Returns the entropies of the byte histograms in the rows of `counts`, for texts of `lengths`."""
+    probabilities = counts / lengths[:, None]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terms = np.where(counts > 0, probabilities * np.log2(probabilities), 0.0)
+    return (0.0 - terms.sum(axis=1)).tolist()
+
+def _batch_entropy(texts):
+    """Computes the entropies of non-empty ASCII texts from a byte histogram per text."""
+    values = []
+    for batch in _entropy_batches(texts):
+        if len(batch[0]) > ENTROPY_BATCH_CHARS:
+            # A batch of its own; its histogram is added up a slice at a time
+            text = batch[0]
+            counts = np.zeros(128, dtype=np.int64)
+            for start in range(0, len(text), ENTROPY_BATCH_CHARS):
+                data = np.frombuffer(text[start:start + ENTROPY_BATCH_CHARS].encode('ascii'), dtype=np.uint8)
+                counts += np.bincount(data, minlength=128)
+            values.extend(_histogram_entropies(counts[None, :], np.array([len(text)], dtype=np.int64)))
+            continue
+        data = np.frombuffer(''.join(batch).encode('ascii'), dtype=np.uint8)
+        lengths = np.fromiter(map(len, batch), dtype=np.int64, count=len(batch))
+        rows = np.repeat(np.arange(len(batch)), lengths)
+        counts = np.bincount(rows * 128 + data, minlength=len(batch) * 128).reshape(len(batch), 128)
+        values.extend(_histogram_entropies(counts, lengths))
+    return values
+
+def entropies(texts):
+    """
+    Computes the Shannon entropy of every text in `texts`, like entropy() but for a whole
+    list at once. Repeated short texts are served from a bounded memo; new ASCII texts are
+    computed together with NumPy. Values agree with entropy() up to float rounding, and a text always
+    gets the same value however it was batched or cached before, so rows do not depend on
+    the order or the processes packages are extracted in.
+    """
+    cache = _entropy_cache
+    results = [cache.get(text) if len(text) <= MEMO_MAX_CHARS else None for text in texts]
+    missing = {text for text, value in zip(texts, results) if value is None}
+    if not missing:
+        return results
+
+    computed = {}
+    batch = []
+    for text in missing:
+        if text and text.isascii():
+            batch.append(text)
+        else:
+            computed[text] = entropy(text)  # Byte and character histograms differ beyond ASCII
+    if batch:
+        # Even for a handful of texts: entropy() rounds differently, and mixing the two would
+        # make a text's value depend on which texts happened to be computed with it
+        computed.update(zip(batch, _batch_entropy(batch)))
+
+    results = [computed[text] if value is None else value for text, value in zip(texts, results)]
+    memoized = {text: value for text, value in computed.items() if len(text) <= MEMO_MAX_CHARS}
+    if len(cache) + len(memoized) > ENTROPY_CACHE_SIZE:
+        cache.clear()
+    if len(memoized) <= ENTROPY_CACHE_SIZE:
+        cache.update(memoized)
+    return results
+
+def clear_memos():
+    """Empties the entropy and homogeneity memos, so timings start cold (see Benchmark.py)."""
+    _entropy_cache.clear()
+    _memoized_homogeneous.cache_clear()
+
+# Significant digits kept by the approximate Q3 histogram of RunningStats
+APPROX_DIGITS = 4
+
+def _sqrt_of_fraction(numerator, denominator):
+    """Correctly rounded float square root of numerator/denominator, as statistics.stdev returns."""
+    # Enough integer bits that rounding the integer square root to odd gives the correctly
+    # rounded float (2 * 53 + 3 bits, the method statistics uses)
+    shift = (numerator.bit_length() - denominator.bit_length() - 109) // 2
+    if shift >= 0:
+        root = math.isqrt(numerator // (denominator << 2 * shift))
+        root |= root * root * (denominator << 2 * shift) != numerator
+        return (root << shift) / 1
+    root = math.isqrt((numerator << -2 * shift) // denominator)
+    root |= root * root * denominator != numerator << -2 * shift
+    return root / (1 << -shift)
+
+def _quantize(value):
+    """Rounds a value to APPROX_DIGITS significant digits."""
+    if not value:
+        return value
+    return round(value, APPROX_DIGITS - 1 - math.floor(math.log10(abs(value))))
+
+def value_histogram(values):
+    """
+    Summarizes a list of values for RunningStats.add_histogram: the (value, count) pairs in
+    order of first occurrence, whether any value is a float, and the last value.
+    """
+    return {
+        "counts": [[value, count] for value, count in Counter(values).items()],
+        "floats": float in set(map(type, values)),
+        "last": values[-1] if values else None,
+    }
+
+class RunningStats:
+    """
+    Streaming mean, standard deviation, max and Q3 of a sequence of values, without keeping
+    the values themselves. Accumulators can be merged, in order.
+
+    In exact mode the results are identical to statistics.mean, stdev and quantiles(n=4) on
+    the full list; only the distinct values are kept with their counts. In approximate mode
+    memory is bounded no matter how many values are added: the mean and variance are kept
+    with Welford's method and Q3 comes from a histogram of values rounded to APPROX_DIGITS
+    significant digits.
+    """
+
+    def __init__(self, exact=True):
+        self.exact = exact
+        self.n = 0
+        self.floats = False  # Whether the mean is a float even when it is a whole number
+        self.histogram = {}  # Distinct (exact) or rounded (approximate) values and their counts
+        self.max = None
+        self.mean = 0.0  # Welford state, approximate mode only
+        self.m2 = 0.0
+
+    def add(self, value, count=1):
+        """Adds `count` occurrences of `value`."""
+        if type(value) is float:
+            self.floats = True
+        if not self.exact:
+            self.n += count
+            delta = value - self.mean
+            self.mean += delta * count / self.n
+            self.m2 += delta * (value - self.mean) * count
+            if self.max is None or value > self.max:
+                self.max = value
+            value = _quantize(value)
+        else:
+            self.n += count
+        self.histogram[value] = self.histogram.get(value, 0) + count
+
+    def add_histogram(self, histogram):
+        """Adds the values summarized by value_histogram."""
+        for value, count in histogram["counts"]:
+            self.add(value, count)
+        self.floats = self.floats or histogram["floats"]
+
+    def merge(self, other):
+        """Adds every value of another accumulator of the same mode, as if added after this one's."""
+        if not self.exact:
+            n = self.n + other.n
+            if n:
+                delta = other.mean - self.mean
+                self.m2 += other.m2 + delta * delta * self.n * other.n / n
+                self.mean += delta * other.n / n
+            if other.max is not None and (self.max is None or other.max > self.max):
+                self.max = other.max
+        self.n += other.n
+        self.floats = self.floats or other.floats
+        for value, count in other.histogram.items():
+            self.histogram[value] = self.histogram.get(value, 0) + count
+
+    def _sorted_value(self, sorted_values, index):
+        """Returns the value at `index` of the sorted full sequence."""
+        seen = 0
+        for value, count in sorted_values:
+            seen += count
+            if index < seen:
+                return value
+        raise IndexError(index)
+
+    def stats(self):
+        """Returns (mean, standard deviation, max, Q3), with 0 for statistics that are undefined."""
+        n = self.n
+        if not n:
+            return 0, 0, 0, 0  # Default values if no data
+        max_value = max(self.histogram) if self.exact else self.max
+
+        if self.exact:
+            # Exact sums grouped by denominator, like statistics does
+            sums = {}
+            squares = {}
+            for value, count in self.histogram.items():
+                numerator, denominator = value.as_integer_ratio()
+                sums[denominator] = sums.get(denominator, 0) + numerator * count
+                squares[denominator] = squares.get(denominator, 0) + numerator * numerator * count
+            total = sum(Fraction(numerator, denominator) for denominator, numerator in sums.items())
+            mean = total / n
+            if self.floats or mean.denominator != 1:
+                mean = float(mean)
+            else:
+                mean = int(mean)
+            std_dev = 0
+            if n > 1:
+                total_squares = sum(Fraction(numerator, denominator * denominator)
+                                    for denominator, numerator in squares.items())
+                variance = (n * total_squares - total * total) / n / (n - 1)
+                std_dev = _sqrt_of_fraction(variance.numerator, variance.denominator)
+        else:
+            mean = self.mean
+            std_dev = math.sqrt(max(self.m2, 0.0) / (n - 1)) if n > 1 else 0
+
+        if n < 4:
+            return mean, std_dev, max_value, max_value
+
+        # Q3 with the 'exclusive' method of statistics.quantiles
+        sorted_values = sorted(self.histogram.items())
+        m = n + 1
+        j = 3 * m // 4
+        j = 1 if j < 1 else n - 1 if j > n - 1 else j
+        delta = 3 * m - j * 4
+        q3 = (self._sorted_value(sorted_values, j - 1) * (4 - delta) + self._sorted_value(sorted_values, j) * delta) / 4
+        return mean, std_dev, max_value, q3
+
+def entropy_stats(identifier_entropies, string_entropies, setup_identifier_entropies, setup_string_entropies):
+    """Builds the entropy statistics dictionary from the RunningStats of the entropy values."""
+    stats = {}
+    for key, values in (("identifier_entropy", identifier_entropies), ("string_entropy", string_entropies),
+                        ("setup_identifier_entropy", setup_identifier_entropies),
+                        ("setup_string_entropy", setup_string_entropies)):
+        mean, std_dev, max_value, q3 = values.stats()
+        stats[key + "_mean"] = mean
+        stats[key + "_std_dev"] = std_dev
+        stats[key + "_max"] = max_value
+        stats[key + "_q3"] = q3
+    return stats
+
+# Function to compute entropy statistics separately for identifiers and strings
+def compute_entropy_by_category(directory, exact=True):
+    """
+    Computes entropy statistics separately for identifiers and strings in the entire package
+    and separately for setup.py if present. See RunningStats for `exact`.
+    """
+    # Entropy statistics for the full package
+    identifier_entropies = RunningStats(exact)
+    string_entropies = RunningStats(exact)
+
+    # Entropy statistics for setup.py only
+    setup_identifier_entropies = RunningStats(exact)
+    setup_string_entropies = RunningStats(exact)
+
+    # Last computed entropy value. Setup files only contribute the last value they saw to
+    # the setup string entropies, carried over from earlier files when they have none.
+    entropy_value = None
+
+    for fname, content in iter_package_files(directory):
+        is_setup = fname in SETUP_FILES
+
+        # Extract identifiers and compute their entropy
+        values = value_histogram(entropies(identifier_pattern.findall(content)))
+        identifier_entropies.add_histogram(values)
+        if is_setup:
+            setup_identifier_entropies.add_histogram(values)
+        if values["last"] is not None:
+            entropy_value = values["last"]
+
+        # Extract strings and compute their entropy
+        values = value_histogram(entropies(string_pattern.findall(content)))
+        string_entropies.add_histogram(values)
+        if values["last"] is not None:
+            entropy_value = values["last"]
+
+        if is_setup and entropy_value is not None:
+            setup_string_entropies.add(entropy_value)
+
+    return entropy_stats(identifier_entropies, string_entropies, setup_identifier_entropies, setup_string_entropies)
+
+
+def symbol_stats(bracket_counts, equal_counts, plus_counts):
+    """Builds the symbol statistics dictionary from the RunningStats of the per-file symbol counts."""
+    stats = {}
+    for key, counts in (("bracket", bracket_counts), ("equal", equal_counts), ("plus", plus_counts)):
+        mean, std_dev, max_value, q3 = counts.stats()
+        stats[key + "_mean"] = mean
+        stats[key + "_std_dev"] = std_dev
+        stats[key + "_max"] = max_value
+        stats[key + "_q3"] = q3
+    return stats
+
+# Function to count specific symbols in all files of a package
+def count_symbols_in_package(directory, exact=True):
+    bracket_counts = RunningStats(exact)  # Counts of [] in each file
+    equal_counts = RunningStats(exact)  # Counts of = in each file
+    plus_counts = RunningStats(exact)  # Counts of + in each file
+
+    for _, content in iter_package_files(directory):
+        bracket_counts.add(content.count('[') + content.count(']'))
+        equal_counts.add(content.count('='))
+        plus_counts.add(content.count('+'))
+
+    return symbol_stats(bracket_counts, equal_counts, plus_counts)
+
+
+def sniff_archive_format(filepath):
+    """
+    Identifies an archive from its first bytes with a single read.
+    Returns 'zip', 'tar', 'gzip', 'bz2', 'xz', or None if the file is not a known archive.
+    """
+    with open(filepath, 'rb') as f:
+        head = f.read(512)
+    if head.startswith((b'PK\x03\x04', b'PK\x05\x06', b'PK\x07\x08')):
+        return 'zip'
+    if head.startswith(b'\x1f\x8b'):
+        return 'gzip'
+    if head.startswith(b'BZh'):
+        return 'bz2'
+    if head.startswith(b'\xfd7zXZ\x00'):
+        return 'xz'
+    if head[257:262] == b'ustar':
+        return 'tar'
+    # Rare layouts without a leading signature, e.g. self-extracting zips or old V7 tars
+    if zipfile.is_zipfile(filepath):
+        return 'zip'
+    if tarfile.is_tarfile(filepath):
+        return 'tar'
+    return None
+
+# Result format names for tarballs by their sniffed (compression) format
+TAR_FORMATS = {'tar': 'tar', 'gzip': 'tar.gz', 'bz2': 'tar.bz2', 'xz': 'tar.xz'}
+
+def _safe_tar_member(ti, tar):
+    return ti if (not os.path.isabs(ti.name) and ".." not in ti.name.split(os.path.sep)) else None
+
+# Limits on what one archive may unpack to, None for no limit: the uncompressed bytes of
+# its members, the number of members and the ratio of those bytes to the size of the
+# archive. The ratio is only checked once the members add up to RATIO_MIN_BYTES, so small
+# archives of very compressible files are not flagged. An archive that goes over a limit
+# is aborted and flagged (see ArchiveGuard).
+DEFAULT_ARCHIVE_LIMITS = {"max_bytes": 4 * 1024 ** 3, "max_members": 200_000, "max_ratio": 250}
+RATIO_MIN_BYTES = 16 * 1024 * 1024
+
+# Name prefix of the directories archives are unpacked into before they are moved in place
+STAGING_PREFIX = ".extracting-"
+
+# File in the destination of extract_archives recording what each archive was extracted to
+EXTRACTED_RECORD = ".extracted.jsonl"
+
+def archive_limits(limits=None):
+    """Returns `limits` completed with DEFAULT_ARCHIVE_LIMITS. Raises ValueError for invalid limits."""
+    limits = dict(DEFAULT_ARCHIVE_LIMITS, **(limits or {}))
+    for key, value in limits.items():
+        if value is not None and not (isinstance(value, (int, float)) and value > 0):
+            raise ValueError(f"{key} must be None or a number above 0")
+    return limits
+
+class ArchiveLimitError(Exception):
+    """Raised when an archive goes over one of its limits."""
+
+class ArchiveReadError(Exception):
+    """Raised when an archive cannot be read, e.g. when it is corrupt, encrypted or of an unsupported format."""
+
+class ArchiveGuard:
+    """
+    Counts the members and uncompressed bytes of one archive against limits from
+    archive_limits as it is unpacked, so a decompression bomb is stopped at the member
+    that takes it over a limit, before that member is written or read.
+    """
+
+    def __init__(self, limits, archive_size):
+        self.limits = limits
+        self.archive_size = max(archive_size, 1)
+        self.members = 0
+        self.bytes = 0
+
+    def add(self, name, size, members=1):
+        """Counts `members` members of `size` uncompressed bytes in total. Raises ArchiveLimitError over a limit."""
+        self.members += members
+        self.bytes += size
+        limits = self.limits
+        if limits["max_members"] is not None and self.members > limits["max_members"]:
+            raise ArchiveLimitError(f"more than {limits['max_members']} members")
+        if limits["max_bytes"] is not None and self.bytes > limits["max_bytes"]:
+            raise ArchiveLimitError(f"more than {limits['max_bytes']} uncompressed bytes at {name}")
+        if (limits["max_ratio"] is not None and self.bytes >= RATIO_MIN_BYTES
+                and self.bytes > limits["max_ratio"] * self.archive_size):
+            raise ArchiveLimitError(f"compression ratio above {limits['max_ratio']} at {name}")
+
+def move_tree(source, destination):
+    """Moves the contents of directory `source` into `destination`, merging directories that exist in both."""
+    for name in os.listdir(source):
+        src, dst = os.path.join(source, name), os.path.join(destination, name)
+        if os.path.isdir(src) and os.path.isdir(dst):
+            move_tree(src, dst)
+        else:
+            try:
+                os.replace(src, dst)
+            except OSError:
+                if not (os.path.isdir(src) and os.path.isdir(dst)):
+                    raise
+                move_tree(src, dst)  # Created meanwhile by an archive unpacked in parallel
+
+@contextlib.contextmanager
+def staged_extraction(destination):
+    """
+    Yields a new directory inside `destination` to unpack one archive into. Its contents
+    are moved into `destination` afterwards, also when unpacking failed halfway (as when
+    unpacking in place), but not when the archive went over its limits, so nothing of a
+    flagged archive is left behind.
+    """
+    staging = tempfile.mkdtemp(prefix=STAGING_PREFIX, dir=destination)
+    flagged = False
+    try:
+        yield staging
+    except ArchiveLimitError:
+        flagged = True
+        raise
+    finally:
+        try:
+            if not flagged:
+                move_tree(staging, destination)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+
+def set_directory_attrs(directories, destination):
+    """
+    Sets the modification times and modes of the tar `directories` extracted into
+    `destination`, deepest first, as extractall does after extracting all members.
+    """
+    for member in sorted(directories, key=lambda member: member.name, reverse=True):
+        dirpath = os.path.join(destination, member.name)
+        with contextlib.suppress(OSError):
+            os.utime(dirpath, (member.mtime, member.mtime))
+        with contextlib.suppress(OSError):
+            os.chmod(dirpath, member.mode)
+
+def _zip_entry(name):
+    """Returns the top-level entry ZipFile.extractall writes the member `name` to, None for none."""
+    name = name.replace('/', os.sep)
+    if os.altsep:
+        name = name.replace(os.altsep, os.sep)
+    parts = [part for part in os.path.splitdrive(name)[1].split(os.sep) if part not in ('', '.', '..')]
+    return parts[0] if parts else None
+
+def extract_archive(filepath, destination, limits=None):
+    """
+    Extracts a single archive into `destination`, member by member, within `limits` (see
+    DEFAULT_ARCHIVE_LIMITS).
+    Returns a result dictionary with the archive name, its format, the status
+    ('extracted', 'failed', 'flagged' or 'skipped'), the error message of a failed
+    extraction, or the limit a flagged archive went over, and the top-level "entries" it
+    wrote to `destination`.
+    """
+    limits = archive_limits(limits)
+    filename = os.path.basename(filepath)
+    result = {"archive": filename, "format": None, "status": "skipped", "error": None, "entries": []}
+    try:
+        result["format"] = archive_format = sniff_archive_format(filepath)
+        guard = ArchiveGuard(limits, os.path.getsize(filepath))
+        if archive_format == 'zip':
+            with zipfile.ZipFile(filepath, 'r') as z:
+                # The central directory lists every member with its size, and reading a
+                # member never goes past that size, so the limits are checked up front
+                for info in z.infolist():
+                    guard.add(info.filename, info.file_size)
+                # Uses the password "infected" for password-protected zip files
+                z.setpassword(b'infected')
+                result["entries"] = sorted({entry for entry in map(_zip_entry, z.namelist()) if entry})
+                z.extractall(destination)
+            result["status"] = "extracted"
+        elif archive_format is not None:
+            directories = []
+            with staged_extraction(destination) as staging:
+                try:
+                    with tarfile.open(filepath, 'r:*') as t:
+                        result["format"] = TAR_FORMATS[archive_format]
+                        for member in t:
+                            guard.add(member.name, member.size)
+                            # Like extractall, directory modes are set last, so a read-only
+                            # directory can still be written into and moved out of staging
+                            if member.isdir() and _safe_tar_member(member, t) is not None:
+                                directories.append(member)
+                            t.extract(member, staging, set_attrs=not member.isdir(), filter=_safe_tar_member)
+                except tarfile.ReadError:
+                    # Not a tarball inside the compression; only single-file .gz is unpacked
+                    if archive_format != 'gzip' or not filename.endswith('.gz'):
+                        raise
+                    guard.add(filename, 0)
+                    with gzip.open(filepath, 'rb') as f_in, open(os.path.join(staging, filename[:-3]), 'wb') as f_out:
+                        for chunk in iter(lambda: f_in.read(1024 * 1024), b''):
+                            guard.add(filename, len(chunk), members=0)
+                            f_out.write(chunk)
+                result["entries"] = sorted(os.listdir(staging))
+            set_directory_attrs(directories, destination)
+            result["status"] = "extracted"
+    except ArchiveLimitError as e:
+        result["status"] = "flagged"
+        result["error"] = str(e)
+    except (OSError, RuntimeError, EOFError, NotImplementedError, zlib.error, zipfile.BadZipFile, tarfile.TarError) as e:
+        result["status"] = "failed"
+        result["error"] = str(e)
+    return result
+
+def extract_archives(directory, destination=None, workers=None, limits=None):
+    """
+    Extract .zip, .tar, and .gz archives found in `directory`.
+    Extracts into `destination` if provided; otherwise, extracts into `directory`.
+    Uses the password "infected" for password-protected zip files.
+    With `workers` > 1 the archives are extracted in that many parallel processes.
+    Archives that unpack to more than `limits` allow (see DEFAULT_ARCHIVE_LIMITS) are
+    aborted and flagged instead, leaving nothing in `destination`.
+    What each archive was extracted to is recorded in EXTRACTED_RECORD in `destination`.
+    Archives with the same size and modification time as in the record, extracted with the
+    same limits and whose entries are all still there, are not extracted again, so the
+    files of a rerun keep their modification times (see item_unchanged). They are counted
+    as "unchanged"; flagged and skipped archives keep their earlier result, and failed ones
+    are tried again.
+
+    Returns a summary dictionary with the number of extracted, unchanged, failed, flagged
+    and skipped archives and the per-archive results of extract_archive under "archives".
+    """
+    if destination is None:
+        destination = directory
+    os.makedirs(destination, exist_ok=True)
+    limits = archive_limits(limits)
+    record_path = os.path.join(destination, EXTRACTED_RECORD)
+    recorded = read_extracted_record(record_path)
+
+    filepaths = [os.path.join(directory, filename) for filename in os.listdir(directory)
+                 if filename not in (EXTRACTED_RECORD, EXTRACTED_RECORD + ".tmp")]
+    filepaths = [filepath for filepath in filepaths if not os.path.isdir(filepath)]
+    stats = {filepath: os.stat(filepath) for filepath in filepaths}  # Before extracting, so a later change is seen
+    results = {}
+    for filepath in filepaths:
+        result = _unchanged_extraction(recorded.get(os.path.basename(filepath)), stats[filepath], limits, destination)
+        if result is not None:
+            results[filepath] = result
+    todo = [filepath for filepath in filepaths if filepath not in results]
+    destinations = [destination] * len(todo)
+
+    if workers and workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results.update(zip(todo, pool.map(extract_archive, todo, destinations, [limits] * len(todo), chunksize=16)))
+    else:
+        results.update((filepath, extract_archive(filepath, destination, limits)) for filepath in todo)
+    results = [results[filepath] for filepath in filepaths]
+
+    with open(record_path + ".tmp", 'w', encoding='utf-8') as f:
+        for filepath, result in zip(filepaths, results):
+            if result["status"] == "failed":
+                continue
+            recorded = dict(result, status="extracted" if result["status"] == "unchanged" else result["status"])
+            f.write(json.dumps({"size": stats[filepath].st_size, "mtime_ns": stats[filepath].st_mtime_ns,
+                                "limits": limits, "result": recorded}) + "\n")
+    os.replace(record_path + ".tmp", record_path)
+
+    summary = {status: 0 for status in ("extracted", "unchanged", "failed", "flagged", "skipped")}
+    for result in results:
+        summary[result["status"]] += 1
+    summary["archives"] = results
+    return summary
+
+def read_extracted_record(record_path):
+    """Returns {archive name: record entry} from the EXTRACTED_RECORD of an earlier extract_archives, {} if there is none."""
+    entries = {}
+    try:
+        f = open(record_path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return entries
+    with f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+                entries[entry["result"]["archive"]] = entry
+            except (ValueError, KeyError, TypeError):
+                continue
+    return entries
+
+def _unchanged_extraction(entry, stat, limits, destination):
+    """
+    Returns the extract_archive result of an archive recorded in `entry` that need not be
+    extracted again (see extract_archives), with the status "unchanged" if it was extracted,
+    or None if it has to be extracted.
+    """
+    if (entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns
+            or entry["limits"] != limits):
+        return None
+    result = entry["result"]
+    if result["status"] != "extracted":
+        return result
+    if not all(os.path.lexists(os.path.join(destination, name)) for name in result["entries"]):
+        return None
+    return dict(result, status="unchanged")
+
+
+
+# What b64encode output looks like: groups of 4 alphabet characters, the last one possibly
+# padded. Anything else never survives the round trip in is_base64_encoded.
+base64_shape_pattern = re.compile(r'(?:[A-Za-z0-9+/]{4})*(?:[A-Za-z0-9+/]{2}==|[A-Za-z0-9+/]{3}=)?')
+
+def is_base64_encoded(s):
+    if len(s) % 4 or not base64_shape_pattern.fullmatch(s):
+        return False  # Rejected without decoding; most strings end here
+    # The shape guarantees that decoding succeeds; the round trip still rejects strings
+    # whose last character carries bits b64encode would have left zero
+    return base64.b64encode(base64.b64decode(s, validate=True)).decode('ascii') == s
+
+def count_base64(strings):
+    """Counts the quoted strings that are valid base64."""
+    # The length check is inlined, as it alone rejects three quarters of the strings
+    return sum(1 for s in map(str.strip, strings) if not len(s) % 4 and is_base64_encoded(s))
+
+def iter_fused_matches(text, pattern=fused_pattern):
+    """
+    Yields (name, start, end) for the matches of every pattern combined in a pattern from
+    build_fused_pattern, in order of start. Matches of different patterns may overlap; the
+    matches of each pattern are exactly those its own findall finds.
+    """
+    ends = {}
+    for match in pattern.finditer(text):
+        name = match.lastgroup
+        start = match.start()
+        if start < ends.get(name, 0):
+            continue  # Overlaps the previous match of the same pattern
+        end = ends[name] = match.end(name)
+        yield name, start, end
+
+def scan_patterns(content):
+    """
+    Returns the quoted strings of a text (what string_pattern.findall returns) and the
+    number of URL, IP, install and dangerous pattern matches, all from one regex pass.
+    """
+    strings = []
+    counts = {"url": 0, "ip": 0, "install": 0, "dangerous": 0}
+    for name, start, end in iter_fused_matches(content):
+        if name == "string":
+            strings.append(content[start + 1:end - 1])
+        else:
+            counts[name] += 1
+    return strings, counts
+
+def get_total_pattern_counts(root_dir):
+    """
+    Counts the URLs, IPs, base64 strings, install script patterns (in .py files) and
+    dangerous install commands of a package in one regex pass per file, with the
+    setup file counts taken from the same matches.
+    """
+    totals = {"urls": 0, "ips": 0, "base64": 0, "install_patterns": 0, "dangerous": 0}
+    totals.update({"setup_" + key: 0 for key in list(totals)})
+
+    for fname, content in iter_package_files(root_dir):
+        strings, counts = scan_patterns(content)
+        found = {
+            "urls": counts["url"],
+            "ips": counts["ip"],
+            "base64": count_base64(strings),
+            "install_patterns": counts["install"] if fname.endswith(".py") else 0,
+            "dangerous": counts["dangerous"],
+        }
+        prefixes = ("", "setup_") if fname in SETUP_FILES else ("",)
+        for prefix in prefixes:
+            for key, value in found.items():
+                totals[prefix + key] += value
+
+    return totals
+
+def get_total_ip(root_dir):
+    totals = get_total_pattern_counts(root_dir)
+    return totals["ips"], totals["setup_ips"]
+
+def get_total_base64(root_dir):
+    totals = get_total_pattern_counts(root_dir)
+    return totals["base64"], totals["setup_base64"]
+
+
+def get_total_url(root_dir):
+    totals = get_total_pattern_counts(root_dir)
+    return totals["urls"], totals["setup_urls"]
+
+def line_tokens(tokens):
+    """
+    Returns the tokens that can occur inside a single line. Tokens are counted line by line,
+    so a token with a line break before its last character never matches.
+    """
+    return [token for token in tokens if '\n' not in token[:-1]]
+
+def build_token_matcher(tokens):
+    """
+    Builds an Aho-Corasick automaton over the line tokens, so count_tokens finds the
+    occurrences of all tokens in a single scan of the text. Build it once per run and
+    reuse it for every file and package.
+    """
+    goto = [{}]  # Trie transitions per state
+    fail = [0]  # Failure link per state
+    own = [None]  # Token ending in each state
+    lengths = []  # Length per token
+    weights = []  # How often each token appears in the token list
+    token_ids = {}
+
+    for token in tokens:
+        if not token:
+            continue  # str.count('') counts positions, not occurrences
+        if token in token_ids:
+            weights[token_ids[token]] += 1
+            continue
+        state = 0
+        for char in token:
+            if char not in goto[state]:
+                goto[state][char] = len(goto)
+                goto.append({})
+                fail.append(0)
+                own.append(None)
+            state = goto[state][char]
+        token_ids[token] = own[state] = len(lengths)
+        lengths.append(len(token))
+        weights.append(1)
+
+    # Breadth-first pass: failure links, and the tokens ending in each state
+    # (its own token plus those ending in the state its failure link points to)
+    out = [()] * len(goto)
+    queue = deque()
+    for state in goto[0].values():
+        out[state] = () if own[state] is None else (own[state],)
+        queue.append(state)
+    while queue:
+        state = queue.popleft()
+        for char, child in goto[state].items():
+            link = fail[state]
+            while link and char not in goto[link]:
+                link = fail[link]
+            fail[child] = goto[link].get(char, 0)
+            out[child] = ((own[child],) if own[child] is not None else ()) + out[fail[child]]
+            queue.append(child)
+
+    return {"goto": goto, "fail": fail, "out": out, "lengths": lengths, "weights": weights}
+
+def count_tokens(content, matcher):
+    """
+    Counts the occurrences of every token in `content` using a matcher from
+    build_token_matcher. Like str.count, the occurrences of one token never overlap each
+    other, while occurrences of different tokens may overlap.
+    """
+    return count_tokens_in_chunks((content,), matcher)
+
+def count_tokens_in_chunks(chunks, matcher):
+    """Like count_tokens, for a text given as consecutive pieces; matches may span pieces."""
+    goto = matcher["goto"]
+    fail = matcher["fail"]
+    out = matcher["out"]
+    lengths = matcher["lengths"]
+    weights = matcher["weights"]
+    next_start = {}  # First position where the next occurrence of a token may start
+    total = 0
+    state = 0
+    offset = 0
+
+    for content in chunks:
+        for end, char in enumerate(content, offset + 1):
+            following = goto[state].get(char)
+            while following is None:
+                if not state:
+                    following = 0
+                    break
+                state = fail[state]
+                following = goto[state].get(char)
+            state = following
+
+            for token_id in out[state]:
+                if end - lengths[token_id] >= next_start.get(token_id, 0):
+                    next_start[token_id] = end
+                    total += weights[token_id]
+        offset += len(content)
+
+    return total
+
+def get_total_tokens(root_dir, tokens):
+    total_tokens = 0
+    setup_tokens = 0
+    matcher = build_token_matcher(line_tokens(tokens))
+
+    for fname, content in iter_package_files(root_dir):
+        found = count_tokens(content, matcher)
+        total_tokens += found
+
+        # If processing setup.py, store separate counts
+        if fname in SETUP_FILES:
+            setup_tokens += found
+
+    return (
+         total_tokens, setup_tokens
+    )
+
+
+def count_lines_words(content):
+    """Returns (lines, words) of a decoded file, counting lines like iterating over the open file."""
+    lines = content.count('\n')
+    if content and not content.endswith('\n'):
+        lines += 1
+    return lines, len(content.split())
+
+def get_total_lines(root_dir):
+    total_lines = 0
+    total_words = 0
+    setup_lines = 0
+    setup_words = 0
+
+    for fname, content in iter_package_files(root_dir):
+        lines, words = count_lines_words(content)
+        total_lines += lines
+        total_words += words
+
+        # If processing setup.py, store separate counts
+        if fname in SETUP_FILES:
+            setup_lines += lines
+            setup_words += words
+
+    return (
+        total_lines, total_words, setup_lines, setup_words
+    )
+
+def get_total_install_script_patterns(root_dir):
+    return get_total_pattern_counts(root_dir)["install_patterns"]
+
+def get_total_dangerous_install_commands(root_dir):
+    return get_total_pattern_counts(root_dir)["dangerous"]
+
+
+# Per-file kernels of the feature families. Each gets the file name, the decoded content,
+# the results of the intermediate families it requires and the token matcher.
+
+def _kernel_identifiers(fname, content, scratch, matcher):
+    return identifier_pattern.findall(content)
+
+def _kernel_patterns(fname, content, scratch, matcher):
+    return scan_patterns(content)
+
+def _kernel_lines(fname, content, scratch, matcher):
+    lines, words = count_lines_words(content)
+    return {"lines": lines, "words": words}
+
+def _kernel_tokens(fname, content, scratch, matcher):
+    return {"tokens": count_tokens(content, matcher)}
+
+def _kernel_urls(fname, content, scratch, matcher):
+    return {"urls": scratch["patterns"][1]["url"]}
+
+def _kernel_base64(fname, content, scratch, matcher):
+    return {"base64": count_base64(scratch["patterns"][0])}
+
+def _kernel_ips(fname, content, scratch, matcher):
+    return {"ips": scratch["patterns"][1]["ip"]}
+
+def _kernel_symbols(fname, content, scratch, matcher):
+    return {"brackets": content.count('[') + content.count(']'), "equals": content.count('='),
+            "pluses": content.count('+')}
+
+def _kernel_identifier_entropy(fname, content, scratch, matcher):
+    return {"identifier_entropies": value_histogram(entropies(scratch["identifiers"]))}
+
+def _kernel_string_entropy(fname, content, scratch, matcher):
+    return {"string_entropies": value_histogram(entropies(scratch["patterns"][0]))}
+
+def _kernel_homogeneity(fname, content, scratch, matcher):
+    homogeneous_identifiers, heterogeneous_identifiers = count_homogeneous(scratch["identifiers"])
+    homogeneous_strings, heterogeneous_strings = count_homogeneous(scratch["patterns"][0])
+    return {"homogeneous_identifiers": homogeneous_identifiers, "heterogeneous_identifiers": heterogeneous_identifiers,
+            "homogeneous_strings": homogeneous_strings, "heterogeneous_strings": heterogeneous_strings}
+
+def _kernel_install_patterns(fname, content, scratch, matcher):
+    return {"install_patterns": scratch["patterns"][1]["install"] if fname.endswith(".py") else 0}
+
+def _kernel_dangerous(fname, content, scratch, matcher):
+    return {"dangerous": scratch["patterns"][1]["dangerous"]}
+
+# Feature families, dependencies before the families requiring them. Each declares
+#   columns   the CSV columns it produces
+#   keys      the per-file results its kernel returns; intermediates have none and only
+#             feed the families requiring them (their results are not kept)
+#   requires  the families its kernel or its aggregation needs
+#   kernel    the per-file kernel, None if the columns need no file contents
+#   version   bump it when the kernel changes, so only this family's cached results are redone
+# A run computes only the families its columns need (see select_families).
+FEATURE_FAMILIES = {
+    "identifiers": {"columns": (), "keys": (), "requires": (), "kernel": _kernel_identifiers, "version": 1},
+    "patterns": {"columns": (), "keys": (), "requires": (), "kernel": _kernel_patterns, "version": 1},
+    "lines": {
+        "columns": ("Total Lines", "Total Words", "Setup Total Lines", "Setup Total Words"),
+        "keys": ("lines", "words"), "requires": (), "kernel": _kernel_lines, "version": 1,
+    },
+    "tokens": {
+        "columns": ("Total Tokens", "Setup Total Tokens"),
+        "keys": ("tokens",), "requires": (), "kernel": _kernel_tokens, "version": 1,
+    },
+    "urls": {
+        "columns": ("Total URLs", "Setup Total URLs"),
+        "keys": ("urls",), "requires": ("patterns",), "kernel": _kernel_urls, "version": 1,
+    },
+    "base64": {
+        "columns": ("Total Base64", "Setup Total Base64"),
+        "keys": ("base64",), "requires": ("patterns",), "kernel": _kernel_base64, "version": 1,
+    },
+    "ips": {
+        "columns": ("Total IPs", "Setup Total IPs"),
+        "keys": ("ips",), "requires": ("patterns",), "kernel": _kernel_ips, "version": 1,
+    },
+    "symbols": {
+        "columns": tuple(f"{symbol} {stat}" for symbol in ("Bracket", "Equal", "Plus")
+                         for stat in ("Mean", "Std Dev", "Max", "Q3")),
+        "keys": ("brackets", "equals", "pluses"), "requires": (), "kernel": _kernel_symbols, "version": 1,
+    },
+    "identifier_entropy": {
+        "columns": tuple(f"{prefix}Identifier Entropy {stat}" for prefix in ("", "Setup ")
+                         for stat in ("Mean", "Std Dev", "Max", "Q3")),
+        "keys": ("identifier_entropies",), "requires": ("identifiers",), "kernel": _kernel_identifier_entropy,
+        "version": 1,
+    },
+    # The setup string entropies carry over the last identifier entropy as well
+    "string_entropy": {
+        "columns": tuple(f"{prefix}String Entropy {stat}" for prefix in ("", "Setup ")
+                         for stat in ("Mean", "Std Dev", "Max", "Q3")),
+        "keys": ("string_entropies",), "requires": ("patterns", "identifier_entropy"),
+        "kernel": _kernel_string_entropy, "version": 1,
+    },
+    "homogeneity": {
+        "columns": tuple(f"{prefix}{kind} {items}" for prefix in ("", "Setup ")
+                         for items in ("Identifiers", "Strings") for kind in ("Homogeneous", "Heterogeneous")),
+        "keys": ("homogeneous_identifiers", "heterogeneous_identifiers", "homogeneous_strings", "heterogeneous_strings"),
+        "requires": ("identifiers", "patterns"), "kernel": _kernel_homogeneity, "version": 1,
+    },
+    "install_patterns": {
+        "columns": ("Total Install Script in .py",),
+        "keys": ("install_patterns",), "requires": ("patterns",), "kernel": _kernel_install_patterns, "version": 1,
+    },
+    "dangerous": {
+        "columns": ("Total Dangerous Install Commands Count",),
+        "keys": ("dangerous",), "requires": ("patterns",), "kernel": _kernel_dangerous, "version": 1,
+    },
+    "file_types": {
+        "columns": tuple(ext.upper() + " Count" for ext in FILE_TYPES),
+        "keys": (), "requires": (), "kernel": None, "version": 1,
+    },
+}
+
+# The family producing each CSV column
+COLUMN_FAMILIES = {column: name for name, family in FEATURE_FAMILIES.items() for column in family["columns"]}
+
+def with_requirements(names):
+    """Returns the families `names` together with everything they require, in registry order."""
+    needed = set()
+    stack = list(names)
+    while stack:
+        name = stack.pop()
+        if name not in needed:
+            needed.add(name)
+            stack.extend(FEATURE_FAMILIES[name]["requires"])
+    return [name for name in FEATURE_FAMILIES if name in needed]
+
+def select_families(columns=None):
+    """
+    Returns the families needed to compute the CSV `columns` (all when None), in registry
+    order. Raises ValueError for unknown columns.
+    """
+    if columns is None:
+        return list(FEATURE_FAMILIES)
+    columns = [column for column in columns if column not in ("PackageName", APPROXIMATE_COLUMN)]
+    unknown = [column for column in columns if column not in COLUMN_FAMILIES]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return with_requirements(COLUMN_FAMILIES[column] for column in columns)
+
+def family_keys(families):
+    """Returns the per-file result keys of `families`."""
+    return [key for name in families for key in FEATURE_FAMILIES[name]["keys"]]
+
+def reads_content(families):
+    """Tells whether any of `families` has a kernel; the others only need the file names."""
+    return any(FEATURE_FAMILIES[name]["kernel"] is not None for name in families)
+
+def scan_file(fname, content, matcher, families=None, profile=None):
+    """
+    Computes the per-file metrics of `families` (from select_families, default all) from
+    the decoded content of one file, so each file of a package is read and decoded only
+    once. `matcher` comes from build_token_matcher. With a PackageProfile, each family's
+    kernel is timed.
+    """
+    features = {}
+    scratch = {}
+    for name in FEATURE_FAMILIES if families is None else families:
+        family = FEATURE_FAMILIES[name]
+        if family["kernel"] is None:
+            continue
+        with profiled(profile, name, len(content)):
+            result = family["kernel"](fname, content, scratch, matcher)
+        if family["keys"]:
+            features.update(result)
+        else:
+            scratch[name] = result
+    return features
+
+
+# Files of at least this many bytes are memory mapped and, if they are plain ASCII,
+# scanned as bytes instead of being decoded (see scan_plain_ascii)
+MMAP_MIN_BYTES = 16 * 1024 * 1024
+MMAP_CHUNK_BYTES = 4 * 1024 * 1024
+MATCH_BATCH = 65536  # Matched identifiers or strings decoded and measured at a time
+
+# Bytes versions of the patterns used by scan_plain_ascii
+identifier_bytes_pattern = re.compile(identifier_pattern.pattern.encode('ascii'))
+fused_bytes_pattern = build_fused_pattern(
+    [(name, re.compile(pattern.pattern.encode('ascii'), pattern.flags & re.IGNORECASE))
+     for name, pattern in FUSED_PATTERNS],
+    FUSED_FIRST_CHARS.replace("\u017f", ""))
+
+# Bytes for which the decoded text or the str pattern semantics differ from the raw bytes:
+# non-ASCII, carriage returns (newline translation) and the \x1c-\x1f separators
+# (whitespace to str.split and str patterns, but not to bytes)
+not_plain_ascii_pattern = re.compile(rb'[\x80-\xff\r\x1c-\x1f]')
+
+def _measure_matches(texts, with_entropy, with_homogeneity, with_base64):
+    """
+    Entropy histogram (like value_histogram), homogeneous and heterogeneous counts, and
+    the base64 count of a stream of identifiers or strings, taken MATCH_BATCH at a time.
+    Only the parts asked for are computed.
+    """
+    counts = {}
+    floats = False
+    last = None
+    homogeneous = heterogeneous = found_base64 = 0
+    while True:
+        batch = list(islice(texts, MATCH_BATCH))
+        if not batch:
+            break
+        if with_entropy:
+            values = entropies(batch)
+            for value in values:
+                counts[value] = counts.get(value, 0) + 1
+            floats = floats or float in set(map(type, values))
+            last = values[-1]
+        if with_homogeneity:
+            batch_homogeneous, batch_heterogeneous = count_homogeneous(batch)
+            homogeneous += batch_homogeneous
+            heterogeneous += batch_heterogeneous
+        if with_base64:
+            found_base64 += count_base64(batch)
+    histogram = {"counts": [[value, count] for value, count in counts.items()], "floats": floats, "last": last}
+    return histogram, homogeneous, heterogeneous, found_base64
+
+def scan_plain_ascii(fname, data, matcher, families=None):
+    """
+    Computes the scan_file results straight from the bytes of a file, usually a memory map,
+    without decoding it. Only matched identifiers and strings are decoded, a batch at a time,
+    so memory stays flat however large the file is. This is exact only for plain ASCII
+    (see not_plain_ascii_pattern); returns None for any other file.
+    """
+    if not_plain_ascii_pattern.search(data):
+        return None
+    families = list(FEATURE_FAMILIES) if families is None else families
+    results = {}
+
+    if "lines" in families or "symbols" in families:
+        lines = words = brackets = equals = pluses = 0
+        in_word = False
+        for start in range(0, len(data), MMAP_CHUNK_BYTES):
+            chunk = data[start:start + MMAP_CHUNK_BYTES]
+            lines += chunk.count(b'\n')
+            words += len(chunk.split())
+            if in_word and not chunk[:1].isspace():
+                words -= 1  # A word cut in two by the chunk boundary
+            in_word = not chunk[-1:].isspace()
+            brackets += chunk.count(b'[') + chunk.count(b']')
+            equals += chunk.count(b'=')
+            pluses += chunk.count(b'+')
+        if len(data) and data[-1:] != b'\n':
+            lines += 1
+        results.update(lines=lines, words=words, brackets=brackets, equals=equals, pluses=pluses)
+
+    if "tokens" in families:
+        results["tokens"] = count_tokens_in_chunks((data[start:start + MMAP_CHUNK_BYTES].decode('ascii')
+                                                    for start in range(0, len(data), MMAP_CHUNK_BYTES)), matcher)
+
+    with_entropy = "identifier_entropy" in families
+    with_homogeneity = "homogeneity" in families
+    if "identifiers" in families:
+        histogram, homogeneous, heterogeneous, _ = _measure_matches(
+            (match.group().decode('ascii') for match in identifier_bytes_pattern.finditer(data)),
+            with_entropy, with_homogeneity, False)
+        results.update(identifier_entropies=histogram, homogeneous_identifiers=homogeneous,
+                       heterogeneous_identifiers=heterogeneous)
+
+    if "patterns" in families:
+        counts = {"url": 0, "ip": 0, "install": 0, "dangerous": 0}
+        def strings():
+            # Counts the other fused patterns on the way
+            for name, start, end in iter_fused_matches(data, fused_bytes_pattern):
+                if name == "string":
+                    yield data[start + 1:end - 1].decode('ascii')
+                else:
+                    counts[name] += 1
+        histogram, homogeneous, heterogeneous, found_base64 = _measure_matches(
+            strings(), "string_entropy" in families, with_homogeneity, "base64" in families)
+        results.update(string_entropies=histogram, homogeneous_strings=homogeneous,
+                       heterogeneous_strings=heterogeneous, base64=found_base64,
+                       urls=counts["url"], ips=counts["ip"], dangerous=counts["dangerous"],
+                       install_patterns=counts["install"] if fname.endswith(".py") else 0)
+
+    return {key: results[key] for key in family_keys(families)}
+
+def analyze_file(fname, raw, matcher, families=None, profile=None):
+    """
+    Returns the scan_file results for the raw bytes (or memory map) of a file. Large plain
+    ASCII files are scanned as bytes, everything else is decoded first.
+    """
+    if len(raw) >= MMAP_MIN_BYTES:
+        with profiled(profile, "plain_ascii", len(raw)):
+            features = scan_plain_ascii(fname, raw, matcher, families)
+        if features is not None:
+            return features
+    with profiled(profile, "decode", len(raw)):
+        content = decode_text(raw)
+    return scan_file(fname, content, matcher, families, profile)
+
+
+# Per-file counts summed into the package totals (and the setup totals for setup files)
+SUMMED_COUNTS = ("lines", "words", "tokens", "urls", "base64", "ips",
+                 "homogeneous_identifiers", "heterogeneous_identifiers",
+                 "homogeneous_strings", "heterogeneous_strings")
+
+def new_package_features(exact_stats=True, keep_files=False):
+    """
+    Returns an empty accumulator for the per-file results of one package.
+    See RunningStats for `exact_stats`. With `keep_files`, add_file also keeps every file's
+    results for the per-file table.
+    """
+    package = {key: 0 for key in SUMMED_COUNTS}
+    package.update({"setup_" + key: 0 for key in SUMMED_COUNTS})
+    package.update({
+        "install_patterns": 0,
+        "dangerous": 0,
+        "bracket_counts": RunningStats(exact_stats),
+        "equal_counts": RunningStats(exact_stats),
+        "plus_counts": RunningStats(exact_stats),
+        "identifier_entropies": RunningStats(exact_stats),
+        "string_entropies": RunningStats(exact_stats),
+        "setup_identifier_entropies": RunningStats(exact_stats),
+        "setup_string_entropies": RunningStats(exact_stats),
+        "last_entropy": None,
+        "file_types": {ext: 0 for ext in FILE_TYPES},
+        "scan_report": {key: 0 for key in SCAN_REPORT_COUNTS},
+        "files": [] if keep_files else None,
+        "approximate": False,
+        "population_bytes": 0,
+        "sample_bytes": 0,
+        "sample_counts": {key: 0 for key in EXTRAPOLATED_COUNTS},
+    })
+    return package
+
+def add_file_features(package, fname, features):
+    """
+    Adds one file to the package accumulator. `features` is the result of scan_file,
+    or None for files that could not be read (they only count towards the file types).
+    Files must be added in walk order.
+    """
+    ext = fname.split('.')[-1].lower()
+    if ext in package["file_types"]:
+        package["file_types"][ext] += 1
+    if features is None:
+        return
+
+    # Only the families computed in this run are present
+    is_setup = fname in SETUP_FILES
+    for key in SUMMED_COUNTS:
+        if key in features:
+            package[key] += features[key]
+            if is_setup:
+                package["setup_" + key] += features[key]
+    package["install_patterns"] += features.get("install_patterns", 0)
+    package["dangerous"] += features.get("dangerous", 0)
+    if "brackets" in features:
+        package["bracket_counts"].add(features["brackets"])
+        package["equal_counts"].add(features["equals"])
+        package["plus_counts"].add(features["pluses"])
+
+    if "identifier_entropies" in features:
+        package["identifier_entropies"].add_histogram(features["identifier_entropies"])
+        if features["identifier_entropies"]["last"] is not None:
+            package["last_entropy"] = features["identifier_entropies"]["last"]
+        if "string_entropies" in features:
+            package["string_entropies"].add_histogram(features["string_entropies"])
+            if features["string_entropies"]["last"] is not None:
+                package["last_entropy"] = features["string_entropies"]["last"]
+        if is_setup:
+            package["setup_identifier_entropies"].add_histogram(features["identifier_entropies"])
+            if package["last_entropy"] is not None:
+                package["setup_string_entropies"].add(package["last_entropy"])
+
+def package_row(pkg, package, columns=None):
+    """
+    Builds the CSV row for a package accumulator, in CSV_HEADER order or with just the
+    given `columns` (from select_columns). Call extrapolate_counts first for a package
+    that was sampled.
+    """
+    if columns is not None:
+        row = package_row(pkg, package)
+        return [int(package["approximate"]) if column == APPROXIMATE_COLUMN else row[CSV_COLUMN_INDEX[column]]
+                for column in columns]
+    symbols = symbol_stats(package["bracket_counts"], package["equal_counts"], package["plus_counts"])
+    entropies = entropy_stats(package["identifier_entropies"], package["string_entropies"],
+                              package["setup_identifier_entropies"], package["setup_string_entropies"])
+    return [
+        pkg,
+        package["lines"], package["words"], package["tokens"], package["urls"], package["base64"], package["ips"],
+        symbols["bracket_mean"], symbols["bracket_std_dev"], symbols["bracket_max"], symbols["bracket_q3"],
+        symbols["equal_mean"], symbols["equal_std_dev"], symbols["equal_max"], symbols["equal_q3"],
+        symbols["plus_mean"], symbols["plus_std_dev"], symbols["plus_max"], symbols["plus_q3"],
+        entropies["identifier_entropy_mean"], entropies["identifier_entropy_std_dev"], entropies["identifier_entropy_max"], entropies["identifier_entropy_q3"],
+        entropies["string_entropy_mean"], entropies["string_entropy_std_dev"], entropies["string_entropy_max"], entropies["string_entropy_q3"],
+        package["homogeneous_identifiers"], package["heterogeneous_identifiers"],
+        package["homogeneous_strings"], package["heterogeneous_strings"],
+        package["setup_lines"], package["setup_words"], package["setup_tokens"], package["setup_urls"], package["setup_base64"], package["setup_ips"],
+        entropies["setup_identifier_entropy_mean"], entropies["setup_identifier_entropy_std_dev"],
+        entropies["setup_identifier_entropy_max"], entropies["setup_identifier_entropy_q3"],
+        entropies["setup_string_entropy_mean"], entropies["setup_string_entropy_std_dev"],
+        entropies["setup_string_entropy_max"], entropies["setup_string_entropy_q3"],
+        package["setup_homogeneous_identifiers"], package["setup_heterogeneous_identifiers"],
+        package["setup_homogeneous_strings"], package["setup_heterogeneous_strings"], package["install_patterns"], package["dangerous"]
+    ] + list(package["file_types"].values())
+
+# Bytes at the start of a file used to tell binary files from text
+SNIFF_BYTES = 8192
+
+# Signatures of binary formats commonly shipped in packages. They only mark a file binary
+# together with bytes that are not valid UTF-8 (see is_binary_file).
+BINARY_MAGIC = (
+    b'\x7fELF',  # Linux shared objects and executables
+    b'MZ',  # Windows DLLs and executables
+    b'\xca\xfe\xba\xbe', b'\xcf\xfa\xed\xfe', b'\xce\xfa\xed\xfe',  # Mach-O and Java classes
+    b'\x00asm',  # WebAssembly
+    b'PK\x03\x04', b'\x1f\x8b', b'BZh', b'\xfd7zXZ\x00', b'7z\xbc\xaf\x27\x1c',  # Archives
+    b'\x89PNG', b'GIF8', b'\xff\xd8\xff', b'BM', b'II*\x00', b'MM\x00*', b'RIFF', b'\x00\x00\x01\x00',  # Images
+    b'%PDF', b'\xd0\xcf\x11\xe0',  # Documents
+    b'OggS', b'fLaC', b'ID3', b'\x1aE\xdf\xa3',  # Audio and video
+    b'wOFF', b'wOF2', b'\x00\x01\x00\x00\x00', b'OTTO',  # Fonts
+    b'SQLite format 3\x00', b'\x93NUMPY',
+)
+
+# Extensions of binary formats. A file with one of these extensions is still scanned as
+# text if it starts with valid UTF-8, so text hidden behind a binary extension is not missed.
+BINARY_EXTENSIONS = {
+    'so', 'pyd', 'dll', 'exe', 'dylib', 'o', 'a', 'lib', 'class', 'jar', 'wasm', 'pyc', 'pyo',
+    'whl', 'zip', 'gz', 'bz2', 'xz', 'tar', 'deb', 'rpm', '7z',
+    'png', 'gif', 'jpg', 'jpeg', 'bmp', 'ico', 'tif', 'webp', 'psd', 'xcf', 'dcm',
+    'pdf', 'doc', 'swf', 'sqlite', 'pickle', 'pkl', 'npy', 'npz',
+    'aac', 'flac', 'm4a', 'mid', 'mp3', 'ogg', 'wav', 'flv', 'm4v', 'mkv', 'mov', 'mp4', 'mpg', 'webm',
+    'ttf', 'otf', 'eot', 'woff', 'woff2',
+}
+
+def is_binary_file(fname, head):
+    """
+    Tells whether a file is binary from its name and its first SNIFF_BYTES bytes `head`:
+    a NUL byte makes it binary, and so does a known binary signature or a binary extension
+    unless the head is valid UTF-8. Several signatures are plain ASCII (MZ, BM, ID3), so
+    on their own they would also match text, and a script could hide behind them.
+    """
+    if b'\x00' in head:
+        return True
+    if not head.startswith(BINARY_MAGIC) and fname.split('.')[-1].lower() not in BINARY_EXTENSIONS:
+        return False
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A character cut off at the end of the head is not a decoding error
+        return not (len(head) == SNIFF_BYTES and e.start >= SNIFF_BYTES - 3)
+    return False
+
+# What to do with a file before text analysis:
+#   scan      analyze the whole file
+#   truncate  analyze only its first max_bytes bytes
+#   sample    analyze SAMPLE_WINDOWS evenly spaced windows of max_bytes bytes in total
+#   skip      do not analyze it; it only counts towards the file types
+SCAN_ACTIONS = ("scan", "truncate", "sample", "skip")
+SAMPLE_WINDOWS = 4
+
+# "binary" applies to binary files, "oversized" to text files larger than max_bytes.
+# The default analyzes every file in full, like the original extractors.
+DEFAULT_FILE_POLICY = {"binary": "scan", "oversized": "scan", "max_bytes": 1024 * 1024}
+
+def file_policy(policy=None):
+    """Returns `policy` completed with DEFAULT_FILE_POLICY. Raises ValueError for unknown actions."""
+    policy = dict(DEFAULT_FILE_POLICY, **(policy or {}))
+    for key in ("binary", "oversized"):
+        if policy[key] not in SCAN_ACTIONS:
+            raise ValueError(f"Unknown {key} file action {policy[key]!r}, expected one of {SCAN_ACTIONS}")
+    if not isinstance(policy["max_bytes"], int) or policy["max_bytes"] < SAMPLE_WINDOWS:
+        raise ValueError(f"max_bytes must be an integer of at least {SAMPLE_WINDOWS}")
+    return policy
+
+def scan_ranges(fname, head, size, policy):
+    """
+    Applies the file policy to a file of `size` bytes starting with `head`. Returns the
+    (offset, length) ranges of the file to analyze, empty for a skipped file, and a record
+    of the decision for the scan report.
+    """
+    binary = is_binary_file(fname, head)
+    oversized = size > policy["max_bytes"]
+    action = policy["binary"] if binary else policy["oversized"] if oversized else "scan"
+    max_bytes = policy["max_bytes"]
+
+    if action == "skip":
+        ranges = []
+    elif action == "scan" or size <= max_bytes:
+        ranges = [(0, size)]
+    elif action == "truncate":
+        ranges = [(0, max_bytes)]
+    else:
+        window = max_bytes // SAMPLE_WINDOWS
+        ranges = [(i * (size - window) // (SAMPLE_WINDOWS - 1), window) for i in range(SAMPLE_WINDOWS)]
+    scanned = sum(length for _, length in ranges)
+    return ranges, {"bytes": size, "scanned_bytes": scanned, "binary": binary, "oversized": oversized,
+                    "action": action if scanned < size else "scan"}
+
+def read_scan_bytes(fpath, fname, policy, digest=False):
+    """
+    Reads the part of a file the policy selects for analysis, without reading skipped
+    bytes. Returns (bytes or None when skipped, scan record). Sampled windows are joined
+    by newlines. A whole file of at least MMAP_MIN_BYTES is returned as a read-only memory
+    map instead, which the caller closes. With `digest`, the record of a file that is read
+    whole gets the SHA-256 of the bytes read as "sha256", for the feature cache and the
+    package manifest. Raises OSError if the file cannot be read.
+    """
+    with open(fpath, 'rb') as f:
+        head = f.read(SNIFF_BYTES)
+        if len(head) < SNIFF_BYTES:
+            size = len(head)
+        else:
+            size = os.fstat(f.fileno()).st_size
+        ranges, record = scan_ranges(fname, head, size, policy)
+        if not ranges:
+            return None, record
+        if ranges == [(0, size)]:
+            if size >= MMAP_MIN_BYTES:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(data, 'madvise'):
+                    data.madvise(mmap.MADV_SEQUENTIAL)  # Let the kernel drop pages already scanned
+            else:
+                data = head + f.read()  # Also picks up bytes appended since the stat
+            if digest:
+                record["sha256"] = hashlib.sha256(data).hexdigest()
+            return data, record
+        chunks = []
+        for offset, length in ranges:
+            f.seek(offset)
+            chunks.append(f.read(length))
+        return b'\n'.join(chunks), record
+
+def select_scan_bytes(fname, raw, policy):
+    """Like read_scan_bytes, for a file that is already in memory."""
+    ranges, record = scan_ranges(fname, raw[:SNIFF_BYTES], len(raw), policy)
+    if not ranges:
+        return None, record
+    if len(ranges) == 1:
+        offset, length = ranges[0]
+        return raw[offset:offset + length], record
+    return b'\n'.join(raw[offset:offset + length] for offset, length in ranges), record
+
+# Per-package counters of the scan report
+SCAN_REPORT_COUNTS = ("files", "bytes", "scanned_bytes", "skipped_bytes", "binary_files", "binary_bytes",
+                      "oversized_files", "skipped_files", "truncated_files", "sampled_files",
+                      "unsampled_files", "unsampled_bytes")
+
+def add_scan_record(package, record):
+    """Adds the scan record of one file (from scan_ranges) to the package's scan report."""
+    report = package["scan_report"]
+    report["files"] += 1
+    report["bytes"] += record["bytes"]
+    report["scanned_bytes"] += record["scanned_bytes"]
+    report["skipped_bytes"] += record["bytes"] - record["scanned_bytes"]
+    if record["binary"]:
+        report["binary_files"] += 1
+        report["binary_bytes"] += record["bytes"]
+    if record["oversized"]:
+        report["oversized_files"] += 1
+    if record["action"] != "scan":
+        report[{"skip": "skipped_files", "truncate": "truncated_files", "sample": "sampled_files"}[record["action"]]] += 1
+    if record.get("sampling") == "unsampled":
+        report["unsampled_files"] += 1
+        report["unsampled_bytes"] += record["bytes"]
+
+def package_report(pkg, package):
+    """Builds the scan report line of a package accumulator."""
+    return dict(package=pkg, approximate=package["approximate"], **package["scan_report"])
+
+# Per-package limits, None for no limit. Once the files of a package add up to more than
+# max_bytes, or it has taken max_seconds, only a deterministic sample_rate share of its
+# remaining files is analyzed and the counts are extrapolated from them (see PackageBudget).
+DEFAULT_BUDGET = {"max_seconds": None, "max_bytes": None, "sample_rate": 0.1}
+
+def package_budget(budget=None):
+    """Returns `budget` completed with DEFAULT_BUDGET, or None without one. Raises ValueError for invalid limits."""
+    if budget is None:
+        return None
+    budget = dict(DEFAULT_BUDGET, **budget)
+    for key in ("max_seconds", "max_bytes"):
+        if budget[key] is not None and not (isinstance(budget[key], (int, float)) and budget[key] >= 0):
+            raise ValueError(f"{key} must be None or a number of at least 0")
+    if not (isinstance(budget["sample_rate"], (int, float)) and 0 < budget["sample_rate"] <= 1):
+        raise ValueError("sample_rate must be a number above 0 and at most 1")
+    return budget
+
+class PackageBudget:
+    """
+    Tracks the time and bytes one package has taken against a budget from package_budget,
+    and decides which files are analyzed once it is spent. Setup files are always analyzed.
+    Which of the remaining files are sampled only depends on their path inside the package,
+    so the byte limit gives the same rows on every run.
+    """
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.start = time.monotonic()
+        self.bytes = 0
+        self.spent = False
+
+    def sampling(self, path, fname, size):
+        """
+        Returns None for a file of `size` bytes that is analyzed as usual, or "sampled" or
+        "unsampled" for a file met after the budget was spent.
+        """
+        if not self.spent and fname not in SETUP_FILES:
+            max_seconds, max_bytes = self.budget["max_seconds"], self.budget["max_bytes"]
+            self.spent = ((max_seconds is not None and time.monotonic() - self.start >= max_seconds)
+                          or (max_bytes is not None and self.bytes + size > max_bytes))
+        if not self.spent or fname in SETUP_FILES:
+            self.bytes += size
+            return None
+        return "sampled" if zlib.crc32(path.encode('utf-8')) < self.budget["sample_rate"] * 2 ** 32 else "unsampled"
+
+def unsampled_record(size, policy):
+    """Returns the scan record of a file of `size` bytes left out by sampling, without reading it."""
+    return {"bytes": size, "scanned_bytes": 0, "binary": None, "oversized": size > policy["max_bytes"],
+            "action": "skip" if size else "scan", "sampling": "unsampled"}
+
+# Counts scaled up from the sampled files of a package that went over its budget
+EXTRAPOLATED_COUNTS = SUMMED_COUNTS + ("install_patterns", "dangerous")
+
+def add_sampling(package, features, record):
+    """
+    Keeps the bytes and counts of a file analyzed or left out after the package budget was
+    spent (its record has a "sampling"), for extrapolate_counts.
+    """
+    sampling = None if record is None else record.get("sampling")
+    if sampling is None:
+        return
+    package["approximate"] = True
+    package["population_bytes"] += record["bytes"]
+    if sampling == "sampled":
+        package["sample_bytes"] += record["bytes"]
+        if features is not None:
+            for key in EXTRAPOLATED_COUNTS:
+                package["sample_counts"][key] += features.get(key, 0)
+
+def extrapolate_counts(package):
+    """
+    Scales the counts of the sampled files up to every file met after the budget was spent,
+    by their share of its bytes. The statistics columns are taken from the sampled files
+    as they are. Called once, after the last file of the package.
+    """
+    if not package["sample_bytes"]:
+        return
+    scale = package["population_bytes"] / package["sample_bytes"]
+    for key, count in package["sample_counts"].items():
+        package[key] += round(count * (scale - 1))
+
+def new_extractor_stats():
+    return {"wall": 0.0, "cpu": 0.0, "files": 0, "bytes": 0}
+
+class PackageProfile:
+    """
+    Wall time, CPU time, files and bytes of every extractor run on one package: reading the
+    files ("read"), the results cache ("cache"), decoding ("decode"), the kernel of each
+    feature family (by family name) and the bytes scan of large plain ASCII files
+    ("plain_ascii"). Kernels count the characters of the decoded text as their bytes. CPU
+    time is that of the extracting thread.
+    With `trace_memory`, the peak of the memory Python allocates while the package is
+    extracted is traced with tracemalloc. That slows extraction down, and memory maps are
+    not included. In archive mode the peak covers everything since the package's first member.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.extractors = {}
+        self.base_memory = None
+        self.peak_memory = None
+        self.prefetch = None
+        if trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            self.base_memory = tracemalloc.get_traced_memory()[0]
+
+    def add(self, extractor, wall, cpu, nbytes=0):
+        """Adds one file of `nbytes` through `extractor`, or time spent on the package itself when None."""
+        if extractor is None:
+            self.wall += wall
+            self.cpu += cpu
+            return
+        stats = self.extractors.setdefault(extractor, new_extractor_stats())
+        stats["wall"] += wall
+        stats["cpu"] += cpu
+        stats["files"] += 1
+        stats["bytes"] += nbytes
+
+    @contextlib.contextmanager
+    def timing(self, extractor=None, nbytes=0):
+        """
+        Times the block as one file through `extractor` (see add). Yields a dict whose
+        "bytes" can be set inside the block when they are only known there.
+        """
+        measured = {"bytes": nbytes}
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield measured
+        finally:
+            self.add(extractor, time.perf_counter() - wall, time.thread_time() - cpu, measured["bytes"])
+
+    def add_prefetch(self, read_seconds, ready, in_flight):
+        """
+        Adds a file taken from the read_files read-ahead: how long its read took on the I/O
+        thread, and how many reads behind it were finished (`ready`) or queued (`in_flight`).
+        """
+        if self.prefetch is None:
+            self.prefetch = {"files": 0, "read_seconds": 0.0, "ready": 0, "in_flight": 0, "max_ready": 0}
+        self.prefetch["files"] += 1
+        self.prefetch["read_seconds"] += read_seconds
+        self.prefetch["ready"] += ready
+        self.prefetch["in_flight"] += in_flight
+        self.prefetch["max_ready"] = max(self.prefetch["max_ready"], ready)
+
+    def measure_peak(self):
+        """Takes the peak memory so far, when tracing it."""
+        if self.base_memory is not None:
+            self.peak_memory = max(tracemalloc.get_traced_memory()[1] - self.base_memory, 0)
+
+    def merge(self, other):
+        """Adds the profile of a chunk of the package (see extract_package_chunk)."""
+        self.wall += other.wall
+        self.cpu += other.cpu
+        for extractor, stats in other.extractors.items():
+            total = self.extractors.setdefault(extractor, new_extractor_stats())
+            for key in total:
+                total[key] += stats[key]
+        if other.peak_memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, other.peak_memory)
+        if other.prefetch is not None:
+            if self.prefetch is None:
+                self.prefetch = dict(other.prefetch)
+            else:
+                for key in ("files", "read_seconds", "ready", "in_flight"):
+                    self.prefetch[key] += other.prefetch[key]
+                self.prefetch["max_ready"] = max(self.prefetch["max_ready"], other.prefetch["max_ready"])
+
+    def line(self, pkg):
+        """
+        Returns the profile line of the package; its files and bytes are those read. The times
+        of a split package are summed over its chunks, and its peak is that of the largest chunk.
+        With read-ahead, "read" is the time spent waiting for reads, and "prefetch" has the
+        time the reads took, the mean and max number of finished reads waiting when a file
+        was taken (queue depth) and the mean number of reads queued.
+        """
+        self.measure_peak()
+        read = self.extractors.get("read", new_extractor_stats())
+        line = {"package": pkg, "wall": self.wall, "cpu": self.cpu, "files": read["files"], "bytes": read["bytes"],
+                "peak_memory": self.peak_memory, "extractors": self.extractors}
+        if self.prefetch is not None:
+            files = self.prefetch["files"]
+            line["prefetch"] = {"read_seconds": self.prefetch["read_seconds"], "wait_seconds": read["wall"],
+                                "mean_ready": self.prefetch["ready"] / files, "max_ready": self.prefetch["max_ready"],
+                                "mean_in_flight": self.prefetch["in_flight"] / files}
+        return line
+
+def profiled(profile, extractor=None, nbytes=0):
+    """Returns profile.timing(extractor, nbytes), or a context doing nothing without a profile."""
+    if profile is None:
+        return contextlib.nullcontext({"bytes": nbytes})
+    return profile.timing(extractor, nbytes)
+
+def new_profile(config):
+    """Returns a PackageProfile for a package if `config` asks for profiling, else None."""
+    return PackageProfile(config["trace_memory"]) if config["profile"] else None
+
+def add_file(package, path, fname, features, record):
+    """
+    Adds one file of a package, at `path` inside it, with its scan_file results (None when
+    not analyzed) and its scan record (None when unreadable or not read). Files must be
+    added in walk order.
+    """
+    if record is not None:
+        add_scan_record(package, record)
+    add_file_features(package, fname, features)
+    add_sampling(package, features, record)
+    if package["files"] is not None:
+        package["files"].append((path, fname, features, record))
+
+def package_result(pkg, package, columns=None):
+    """
+    Returns what extracting a package produces: its CSV row (with the given `columns`),
+    its scan report line, if kept its files for the per-file table, and its profile line
+    (set by the caller once the package is done, None when not profiling).
+    """
+    extrapolate_counts(package)
+    return {"package": pkg, "row": package_row(pkg, package, columns), "report": package_report(pkg, package),
+            "files": package["files"], "profile": None}
+
+# Version of the layout of the per-file results. Bump it when that layout changes so that
+# results cached by older code are not reused; changes to a single kernel only need the
+# version of its feature family bumped.
+FEATURE_VERSION = 4
+
+def feature_cache_dir(cache_root, tokens):
+    """
+    Returns the directory inside `cache_root` holding cached per-file results for this
+    FEATURE_VERSION and token list, so a changed token list never reuses stale counts.
+    """
+    fingerprint = hashlib.sha256(json.dumps([FEATURE_VERSION, tokens]).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_root, fingerprint)
+
+def extraction_config(tokens, cache_root=None, exact_stats=True, policy=None, keep_files=False, columns=None,
+                      budget=None, profile=False, trace_memory=False, manifest=False, read_threads=0,
+                      limits=None):
+    """
+    Bundles the settings shared by every package of a run, so they can be handed to worker
+    processes once:
+      matcher      token matcher built from the line tokens
+      cache_dir    per-file results cache inside `cache_root` (see file_features), or None
+      exact_stats  exact or approximate package statistics (see RunningStats)
+      file_policy  which part of binary and oversized files to analyze (see DEFAULT_FILE_POLICY)
+      keep_files   return every file's results for the per-file table
+      columns      the CSV columns written (see select_columns), flagging approximate rows with a budget
+      families     the feature families those columns need, the only ones computed
+      budget       per-package time and byte limits (see DEFAULT_BUDGET), or None
+      profile      time every extractor on every package (see PackageProfile)
+      trace_memory also trace each package's peak memory when profiling
+      manifest     list the files of every item for the package manifest (see item_files)
+      read_threads I/O threads reading files ahead of the analysis, 0 to read inline (see read_files)
+      archive_limits limits on what an archive read directly may unpack to (see DEFAULT_ARCHIVE_LIMITS)
+    Raises ValueError for unknown columns, policy actions or invalid limits.
+    """
+    budget = package_budget(budget)
+    columns = select_columns(columns, flag_approximate=budget is not None)
+    return {
+        "matcher": build_token_matcher(tokens),
+        "cache_dir": None if cache_root is None else feature_cache_dir(cache_root, tokens),
+        "exact_stats": exact_stats,
+        "file_policy": file_policy(policy),
+        "keep_files": keep_files,
+        "columns": columns,
+        "families": select_families(columns),
+        "budget": budget,
+        "profile": profile,
+        "trace_memory": trace_memory,
+        "manifest": manifest,
+        "read_threads": read_threads,
+        "archive_limits": archive_limits(limits),
+    }
+
+def file_features(fname, raw, config, profile=None, digest=None):
+    """
+    Returns scan_file results for the raw bytes of a file (the part selected by the file
+    policy), for the feature families in `config`. With a cache directory in `config` the
+    results are looked up by content hash first, so identical files in other packages or
+    versions are only scanned once. Each cache entry records the version of every family
+    it holds; only families that are missing or outdated are computed and added to it.
+    The results do not depend on whether the file is a setup file; that is applied when
+    they are added to the package. With a PackageProfile, the cache and the analysis are timed.
+    `digest` is the SHA-256 of `raw` if it is known already (see read_scan_bytes).
+    """
+    matcher = config["matcher"]
+    cache_dir = config["cache_dir"]
+    families = config["families"]
+    if cache_dir is None:
+        return analyze_file(fname, raw, matcher, families, profile)
+
+    with profiled(profile, "cache", len(raw)):
+        # The install script count is only taken for .py files, so it is part of the key
+        key = (digest or hashlib.sha256(raw).hexdigest()) + ("-py" if fname.endswith(".py") else "")
+        cache_path = os.path.join(cache_dir, key[:2], key + ".json")
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            versions, features = entry["versions"], entry["features"]
+        except (OSError, ValueError, KeyError, TypeError):
+            versions, features = {}, {}  # Not cached yet, or a damaged entry that is rewritten below
+
+    stale = [name for name in families
+             if FEATURE_FAMILIES[name]["keys"] and versions.get(name) != FEATURE_FAMILIES[name]["version"]]
+    if stale:
+        computing = with_requirements(stale)
+        features.update(analyze_file(fname, raw, matcher, computing, profile))
+        versions.update((name, FEATURE_FAMILIES[name]["version"]) for name in computing if FEATURE_FAMILIES[name]["keys"])
+        with profiled(profile, "cache"):
+            write_cache_entry(cache_path, {"versions": versions, "features": features})
+    return {key: features[key] for key in family_keys(families)}
+
+def write_cache_entry(cache_path, entry):
+    """
+    Writes a feature cache entry atomically, so concurrent workers never see partial entries.
+    The cache only saves work: an entry that cannot be written, e.g. on a full or read-only
+    disk or while another worker has it open on Windows, is left out.
+    """
+    tmp_path = None
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix=os.path.basename(cache_path) + ".",
+                                        dir=os.path.dirname(cache_path))
+        with open(fd, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        if tmp_path is not None:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+
+def extract_package_features(pkg_path, config, manifest=None):
+    """
+    Computes the package_result for one package directory. The package is walked once and
+    every file is read once; all metrics are computed from that single read. Files left
+    out by the package budget are not read at all; without a budget the files are read
+    ahead with read_files. When no family in `config` reads file contents (see
+    reads_content), only the file names are walked.
+    `config` comes from extraction_config. The hashes of the files read whole are filled in
+    the manifest files `manifest` (see item_files).
+    """
+    pkg = os.path.basename(pkg_path)
+    profile = new_profile(config)
+    with profiled(profile):
+        package = new_package_features(config["exact_stats"], config["keep_files"])
+        if not reads_content(config["families"]):
+            for path, fname, _ in package_files(pkg_path):
+                add_file(package, path, fname, None, None)
+        elif config["budget"] is None:
+            files = list(package_files(pkg_path))
+            reads = read_files([(fpath, fname) for _, fname, fpath in files], config, profile)
+            for (path, fname, _), (raw, record) in zip(files, reads):
+                add_manifest_hash(manifest, path, record)
+                add_file(package, path, fname, analyze_read(fname, raw, record, config, profile), record)
+        else:
+            budget = PackageBudget(config["budget"])
+            for path, fname, fpath in package_files(pkg_path):
+                try:
+                    size = os.path.getsize(fpath)
+                except OSError:
+                    add_file(package, path, fname, None, None)
+                    continue
+                sampling = budget.sampling(path, fname, size)
+                if sampling == "unsampled":
+                    add_file(package, path, fname, None, unsampled_record(size, config["file_policy"]))
+                    continue
+                raw, record = read_file(fpath, fname, config["file_policy"], profile, read_digest(config))
+                if sampling is not None and record is not None:
+                    record["sampling"] = sampling
+                add_manifest_hash(manifest, path, record)
+                add_file(package, path, fname, analyze_read(fname, raw, record, config, profile), record)
+        result = package_result(pkg, package, config["columns"])
+    if profile is not None:
+        result["profile"] = profile.line(pkg)
+    return result
+
+def package_files(pkg_path):
+    """
+    Yields (path inside the package, file name, file path) for every file of a package
+    directory, in walk order: os.walk order with the directory and file names sorted, so it
+    is the same on every file system and the same as walk_order gives archive members.
+    The rows depend on this order through the setup string entropy carry-over.
+    """
+    for dirpath, dirnames, subfiles in os.walk(pkg_path):
+        dirnames.sort()
+        for fname in sorted(subfiles):
+            fpath = os.path.join(dirpath, fname)
+            yield os.path.relpath(fpath, pkg_path).replace(os.sep, '/'), fname, fpath
+
+def analyze_read(fname, raw, record, config, profile=None):
+    """
+    Returns the file_features of bytes and their scan record from read_files, None when
+    nothing was read, and closes a memory map.
+    """
+    if raw is None:
+        return None
+    try:
+        return file_features(fname, raw, config, profile, record.get("sha256"))
+    finally:
+        if isinstance(raw, mmap.mmap):
+            raw.close()
+
+# Read-ahead of read_files with I/O threads: at most this many files, and this many bytes
+# read or being read but not analyzed yet
+PREFETCH_FILES = 32
+PREFETCH_BYTES = 64 * 1024 * 1024
+
+def read_digest(config):
+    """
+    Tells whether files are hashed as they are read: the feature cache is keyed by content
+    hash and the manifest records it, so neither has to hash or read the file again.
+    """
+    return config["manifest"] or config["cache_dir"] is not None
+
+def read_file(fpath, fname, policy, profile=None, digest=False):
+    """read_scan_bytes profiled as "read", returning (None, None) for an unreadable file."""
+    try:
+        with profiled(profile, "read") as measured:
+            raw, record = read_scan_bytes(fpath, fname, policy, digest)
+            measured["bytes"] = record["scanned_bytes"]
+    except OSError:
+        return None, None
+    return raw, record
+
+def _timed_read(fpath, fname, policy, digest):
+    """read_scan_bytes on an I/O thread: returns (bytes, record, seconds), with (None, None) for an unreadable file."""
+    start = time.perf_counter()
+    try:
+        raw, record = read_scan_bytes(fpath, fname, policy, digest)
+    except OSError:
+        raw, record = None, None
+    return raw, record, time.perf_counter() - start
+
+def read_files(files, config, profile=None):
+    """
+    Yields (bytes or None, scan record or None when unreadable) for every (file path, file
+    name) in `files`, in order, reading the part the file policy selects (see read_scan_bytes).
+    With config["read_threads"], a pool of that many I/O threads reads up to PREFETCH_FILES
+    files (and PREFETCH_BYTES bytes, see _prefetched_bytes) ahead while the caller analyzes,
+    so slow or network storage does not leave the analysis waiting. The time the caller waits for a read is
+    profiled as "read"; the profile also gets the read-ahead metrics (see
+    PackageProfile.add_prefetch). Memory maps that were read ahead but not taken are closed.
+    The files are hashed as they are read if the feature cache or the manifest needs it
+    (see read_digest).
+    """
+    policy = config["file_policy"]
+    digest = read_digest(config)
+    if not config["read_threads"]:
+        for fpath, fname in files:
+            yield read_file(fpath, fname, policy, profile, digest)
+        return
+
+    remaining = iter(files)
+    queue = deque()
+    with ThreadPoolExecutor(max_workers=config["read_threads"]) as pool:
+        try:
+            while True:
+                while len(queue) < PREFETCH_FILES and _prefetched_bytes(queue) < PREFETCH_BYTES:
+                    file = next(remaining, None)
+                    if file is None:
+                        break
+                    queue.append((pool.submit(_timed_read, *file, policy, digest), _file_size(file[0])))
+                if not queue:
+                    return
+                future, _ = queue.popleft()
+                with profiled(profile, "read") as measured:
+                    raw, record, seconds = future.result()
+                    measured["bytes"] = 0 if record is None else record["scanned_bytes"]
+                if profile is not None:
+                    profile.add_prefetch(seconds, ready=sum(other.done() for other, _ in queue), in_flight=len(queue))
+                yield raw, record
+        finally:
+            for future, _ in queue:
+                if not future.cancel() and isinstance(future.result()[0], mmap.mmap):
+                    future.result()[0].close()
+
+def _file_size(fpath):
+    """Returns the size of a file, 0 if it cannot be read."""
+    try:
+        return os.path.getsize(fpath)
+    except OSError:
+        return 0
+
+def _prefetched_bytes(queue):
+    """
+    Returns the bytes held by the reads in a read_files queue: the bytes of the finished
+    reads, and the file size reserved for the reads still in flight, so large reads in
+    flight cannot take the read-ahead past PREFETCH_BYTES.
+    """
+    held = 0
+    for future, size in queue:
+        if not future.done():
+            held += size
+        elif isinstance(future.result()[0], bytes):
+            held += len(future.result()[0])
+    return held
+
+# Package directories with at least this many files or bytes are split into chunks of
+# files that the worker processes analyze in parallel (see package_chunks)
+SPLIT_MIN_FILES = 2000
+SPLIT_MIN_BYTES = 64 * 1024 * 1024
+CHUNK_FILES = 500
+CHUNK_BYTES = 16 * 1024 * 1024
+
+def package_chunks(pkg_path):
+    """
+    Returns the files of a large package directory (paths inside it, in walk order) cut
+    into consecutive chunks of up to CHUNK_FILES files or about CHUNK_BYTES bytes, or None
+    for a package below SPLIT_MIN_FILES and SPLIT_MIN_BYTES, which is extracted whole.
+    """
+    files = []
+    total = 0
+    for path, _, fpath in package_files(pkg_path):
+        try:
+            size = os.path.getsize(fpath)
+        except OSError:
+            size = 0
+        files.append((path, size))
+        total += size
+    if len(files) < SPLIT_MIN_FILES and total < SPLIT_MIN_BYTES:
+        return None
+
+    chunks = [[]]
+    chunk_bytes = 0
+    for path, size in files:
+        if chunks[-1] and (len(chunks[-1]) >= CHUNK_FILES or chunk_bytes + size > CHUNK_BYTES):
+            chunks.append([])
+            chunk_bytes = 0
+        chunks[-1].append(path)
+        chunk_bytes += size
+    return chunks
+
+def extract_package_chunk(pkg_path, paths, config):
+    """
+    Reads and analyzes one chunk of a split package: the files at `paths` inside the package
+    directory. Returns a dict with the add_file arguments of each file ("files"), their
+    manifest files if `config` keeps a manifest (see item_files) and the chunk's profile.
+    merge_package_chunks adds the chunks up to the package_result of a whole-package run.
+    """
+    profile = new_profile(config)
+    files = []
+    manifest = None
+    with profiled(profile):
+        fpaths = [os.path.join(pkg_path, *path.split('/')) for path in paths]
+        fnames = [path.split('/')[-1] for path in paths]
+        if config["manifest"]:
+            manifest = {path: manifest_file(fpath) for path, fpath in zip(paths, fpaths)}  # Before reading, like item_files
+        for path, fname, (raw, record) in zip(paths, fnames, read_files(list(zip(fpaths, fnames)), config, profile)):
+            add_manifest_hash(manifest, path, record)
+            files.append((path, fname, analyze_read(fname, raw, record, config, profile), record))
+    if profile is not None:
+        profile.measure_peak()
+    return {"files": files, "manifest": manifest, "profile": profile}
+
+def merge_package_chunks(pkg_path, chunks, config):
+    """
+    Adds the chunks of a split package (from extract_package_chunk, in order) to one package,
+    file by file in walk order, so the row is the same as from extract_package_features.
+    Returns an extract_item result.
+    """
+    pkg = os.path.basename(pkg_path)
+    package = new_package_features(config["exact_stats"], config["keep_files"])
+    profile = PackageProfile() if config["profile"] else None
+    files = {} if config["manifest"] else None
+    for chunk in chunks:
+        for file in chunk["files"]:
+            add_file(package, *file)
+        if profile is not None:
+            profile.merge(chunk["profile"])
+        if files is not None:
+            files.update(chunk["manifest"])
+    result = package_result(pkg, package, config["columns"])
+    if profile is not None:
+        result["profile"] = profile.line(pkg)
+    return {"item": pkg, "files": files, "results": [result], "flagged": None, "error": None}
+
+
+def iter_archive_members(archive_path, limits=None):
+    """
+    Yields (member path, raw bytes) for every regular file in a .zip/.whl or .tar(.gz/.bz2/.xz) archive,
+    one member at a time, using the paths extract_archives would write them to.
+    The bytes are None for members that cannot be read. Raises ArchiveLimitError at the
+    member that takes the archive over `limits` (see DEFAULT_ARCHIVE_LIMITS); for zips
+    that is before the first member.
+    """
+    archive_format = sniff_archive_format(archive_path)
+    guard = ArchiveGuard(archive_limits(limits), os.path.getsize(archive_path))
+    if archive_format == 'zip':
+        with zipfile.ZipFile(archive_path, 'r') as z:
+            for info in z.infolist():
+                guard.add(info.filename, info.file_size)
+            z.setpassword(b'infected')
+            for info in z.infolist():
+                if info.is_dir():
+                    continue
+                # Same sanitizing as ZipFile.extractall
+                parts = [part for part in info.filename.split('/') if part not in ('', '.', '..')]
+                if not parts:
+                    continue
+                try:
+                    raw = z.read(info)
+                except (OSError, RuntimeError, zipfile.BadZipFile, NotImplementedError, zlib.error):
+                    raw = None
+                yield '/'.join(parts), raw
+    elif archive_format is not None:
+        try:
+            t = tarfile.open(archive_path, 'r:*')
+        except tarfile.ReadError:
+            return  # Compressed, but not a tarball
+        with t:
+            for member in t:
+                guard.add(member.name, member.size)
+                # Same members the extraction filter in extract_archives lets through
+                if not member.isfile() or os.path.isabs(member.name) or ".." in member.name.split('/'):
+                    continue
+                parts = [part for part in member.name.split('/') if part not in ('', '.')]
+                with t.extractfile(member) as f:
+                    yield '/'.join(parts), f.read()
+
+
+# Bumped when the order files are added to a package in changes, as the rows depend on it
+FILE_ORDER_VERSION = 2
+
+def walk_order(path):
+    """
+    Sort key that puts member paths in the walk order of package_files: the files of a
+    directory before its subdirectories, names sorted by code point within each directory.
+    """
+    parts = path.split('/')
+    return [(1, part) for part in parts[:-1]] + [(0, parts[-1])]
+
+def timed_items(iterator):
+    """Yields (item, wall time, thread CPU time) for every item of `iterator`, timing how long it took to produce."""
+    while True:
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        yield item, time.perf_counter() - wall, time.thread_time() - cpu
+
+def extract_archive_features(archive_path, config):
+    """
+    Computes the package_result of every package in an archive without unpacking it to disk. Like after
+    extract_archives, every top-level directory in the archive is one package; files at
+    the top level belong to no package. Members are read as streams, one at a time. The
+    package budget applies in archive order, from the first member of each package.
+    `config` comes from extraction_config. Raises ArchiveLimitError for an archive over
+    the archive limits in `config`, and ArchiveReadError for an archive that cannot be read.
+    """
+    packages = {}
+    budgets = {}
+    profiles = {}
+    analyzed = reads_content(config["families"])  # Otherwise only the member names are needed
+    members = timed_items(iter_archive_members(archive_path, config["archive_limits"]))
+    while True:
+        # Only reading the archive is caught here; errors of the analysis itself propagate
+        try:
+            member = next(members, None)
+        except (tarfile.TarError, zipfile.BadZipFile, RuntimeError, OSError, EOFError, zlib.error) as e:
+            raise ArchiveReadError(str(e)) from e
+        if member is None:
+            break
+        (path, raw), wall, cpu = member
+        pkg, _, rel_path = path.partition('/')
+        if not rel_path:
+            continue
+        if config["profile"] and pkg not in profiles:
+            profiles[pkg] = new_profile(config)
+        profile = profiles.get(pkg)
+        if profile is not None:
+            profile.add(None, wall, cpu)
+            profile.add("read", wall, cpu, 0 if raw is None else len(raw))
+        with profiled(profile):
+            fname = rel_path.split('/')[-1]
+            features = record = None
+            if raw is not None and analyzed:
+                sampling = None
+                if config["budget"] is not None:
+                    if pkg not in budgets:
+                        budgets[pkg] = PackageBudget(config["budget"])
+                    sampling = budgets[pkg].sampling(rel_path, fname, len(raw))
+                if sampling == "unsampled":
+                    record = unsampled_record(len(raw), config["file_policy"])
+                else:
+                    raw, record = select_scan_bytes(fname, raw, config["file_policy"])
+                    features = None if raw is None else file_features(fname, raw, config, profile)
+                    if sampling is not None:
+                        record["sampling"] = sampling
+            # A later member with the same path overwrites an earlier one, as on extraction
+            packages.setdefault(pkg, {})[rel_path] = (fname, features, record)
+
+    results = []
+    for pkg, files in packages.items():
+        profile = profiles.get(pkg)
+        with profiled(profile):
+            # Files are added in walk order so the setup string entropy carry-over matches
+            # a run over the extracted directory
+            package = new_package_features(config["exact_stats"], config["keep_files"])
+            for rel_path in sorted(files, key=walk_order):
+                add_file(package, rel_path, *files[rel_path])
+            result = package_result(pkg, package, config["columns"])
+        if profile is not None:
+            result["profile"] = profile.line(pkg)
+        results.append(result)
+    return results
+
+
+
+CSV_HEADER = [
+    "PackageName", "Total Lines", "Total Words", "Total Tokens", "Total URLs", "Total Base64", "Total IPs",
+    "Bracket Mean", "Bracket Std Dev", "Bracket Max", "Bracket Q3",
+    "Equal Mean", "Equal Std Dev", "Equal Max", "Equal Q3",
+    "Plus Mean", "Plus Std Dev", "Plus Max", "Plus Q3",
+    "Identifier Entropy Mean", "Identifier Entropy Std Dev", "Identifier Entropy Max", "Identifier Entropy Q3",
+    "String Entropy Mean", "String Entropy Std Dev", "String Entropy Max", "String Entropy Q3",
+    "Homogeneous Identifiers", "Heterogeneous Identifiers", "Homogeneous Strings", "Heterogeneous Strings",
+    "Setup Total Lines", "Setup Total Words", "Setup Total Tokens", "Setup Total URLs", "Setup Total Base64", "Setup Total IPs",
+    "Setup Identifier Entropy Mean", "Setup Identifier Entropy Std Dev", "Setup Identifier Entropy Max", "Setup Identifier Entropy Q3",
+    "Setup String Entropy Mean", "Setup String Entropy Std Dev", "Setup String Entropy Max", "Setup String Entropy Q3",
+    "Setup Homogeneous Identifiers", "Setup Heterogeneous Identifiers", "Setup Homogeneous Strings", "Setup Heterogeneous Strings", "Total Install Script in .py", "Total Dangerous Install Commands Count"
+] + [ext.upper() + " Count" for ext in FILE_TYPES]
+CSV_COLUMN_INDEX = {column: index for index, column in enumerate(CSV_HEADER)}
+
+# Last column of runs with a package budget: 1 for rows extrapolated from sampled files
+APPROXIMATE_COLUMN = "Approximate"
+
+def select_columns(columns=None, flag_approximate=False):
+    """
+    Returns the CSV header for a run writing only `columns` (all when None): PackageName
+    followed by the requested columns in CSV_HEADER order, and APPROXIMATE_COLUMN with
+    `flag_approximate`. The usecols lists of the training scripts can be passed as they
+    are; their Classification label is not a feature and is left out. Raises ValueError
+    for unknown columns.
+    """
+    flag = [APPROXIMATE_COLUMN] if flag_approximate else []
+    if columns is None:
+        return CSV_HEADER + flag
+    unknown = [column for column in columns if column not in CSV_COLUMN_INDEX
+               and column not in ("Classification", APPROXIMATE_COLUMN)]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+    return ["PackageName"] + [column for column in CSV_HEADER[1:] if column in set(columns)] + flag
+
+def extract_item(path, config, from_archives=False):
+    """
+    Extracts a package directory, or every package in an archive. Returns a dict with the
+    "item" name, its "results" (package_results), the limit a "flagged" archive went over
+    (None otherwise), the "error" of an archive that could not be read (None otherwise)
+    and, when `config` keeps a manifest, the manifest "files" of the item, listed before it
+    was read and hashed as it was read (see item_files). A flagged or unreadable archive
+    has no results.
+    """
+    files = item_files(path, from_archives) if config["manifest"] else None
+    flagged = error = None
+    if from_archives:
+        try:
+            results = extract_archive_features(path, config)
+        except ArchiveLimitError as e:
+            print(f"Flagged {os.path.basename(path)}: {e}")
+            results, flagged = [], str(e)
+        except ArchiveReadError as e:
+            print(f"Could not read {os.path.basename(path)}: {e}")
+            results, error = [], str(e)
+    else:
+        results = [extract_package_features(path, config, files)]
+    return {"item": os.path.basename(path), "files": files, "results": results, "flagged": flagged, "error": error}
+
+# Arguments of extract_item for a worker process, set once by the pool initializer
+_worker_args = None
+
+def _init_worker(*args):
+    global _worker_args
+    _worker_args = args
+
+def _extract_in_worker(path, split=False):
+    """
+    Returns the extract_item result of `path`, or with `split` the chunks of a package
+    directory large enough to be split (see package_chunks) instead.
+    """
+    if split:
+        chunks = package_chunks(path)
+        if chunks is not None:
+            return chunks
+    return extract_item(path, *_worker_args)
+
+def _extract_chunk_in_worker(pkg_path, paths):
+    return extract_package_chunk(pkg_path, paths, _worker_args[0])
+
+async def extract_packages(directory, packages, config, workers=None, from_archives=False):
+    """
+    Yields the extract_item result of every package in `packages` (archive names with
+    `from_archives`), in the given order. With `workers` > 1 the packages are spread over
+    that many worker processes; a bounded number of packages is in flight so the rows still
+    come out in order. Large package directories are split into chunks of files that are
+    spread over the workers as well (see package_chunks), so one huge package does not
+    keep a single worker busy while the others are idle. Whether to split is decided by the
+    worker the package is sent to, so the packages are not walked before they are sent.
+    Packages with a budget are not split, as their time limit applies to the package as a whole.
+    """
+    if not workers or workers <= 1:
+        for pkg in packages:
+            yield await asyncio.to_thread(extract_item, os.path.join(directory, pkg), config, from_archives)
+        return
+
+    split = not from_archives and config["budget"] is None and reads_content(config["families"])
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(config, from_archives)) as pool:
+        pending = deque()
+        try:
+            for pkg in packages:
+                path = os.path.join(directory, pkg)
+                pending.append(asyncio.create_task(_extract_in_pool(pool, path, split, config)))
+                if len(pending) >= workers * 4:
+                    yield await pending.popleft()
+            while pending:
+                yield await pending.popleft()
+        finally:
+            for task in pending:
+                task.cancel()
+
+async def _extract_in_pool(pool, path, split, config):
+    """
+    Returns the extract_item result of `path` from a worker process. The chunks of a split
+    package are queued as soon as the worker returns them; whichever worker is free takes
+    the next one, and they are merged here.
+    """
+    loop = asyncio.get_running_loop()
+    work = await loop.run_in_executor(pool, _extract_in_worker, path, split)
+    if not isinstance(work, list):
+        return work
+    chunks = await asyncio.gather(*[loop.run_in_executor(pool, _extract_chunk_in_worker, path, paths)
+                                    for paths in work])
+    return merge_package_chunks(path, chunks, config)
+
+# Bytes read at a time when looking for the last complete row of a partial CSV
+TAIL_BLOCK_BYTES = 64 * 1024
+
+def read_written_packages(csv_path, header=CSV_HEADER):
+    """
+    Returns the PackageNames already written to a partial dataset CSV. A last row that was
+    cut off by a crash is removed from the file so the run can append after it.
+    Raises ValueError if the CSV was written with another `header`.
+    """
+    with open(csv_path, 'rb+') as f:
+        end = f.seek(0, os.SEEK_END)
+        if end:
+            f.seek(end - 1)
+            if f.read(1) != b'\n':
+                # Scans back from the end for the last complete row, a block at a time
+                position = end
+                while position > 0:
+                    start = max(0, position - TAIL_BLOCK_BYTES)
+                    f.seek(start)
+                    newline = f.read(position - start).rfind(b'\n')
+                    if newline != -1:
+                        position = start + newline + 1
+                        break
+                    position = start
+                f.truncate(position)
+
+    with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
+        reader = csv.reader(csvfile)
+        written_header = next(reader, None)
+        if written_header is None:
+            return None  # Empty file, nothing written yet
+        if written_header != header:
+            raise ValueError(f"Cannot resume {csv_path}: it was written with different columns")
+        return {row[0] for row in reader if row}
+
+def read_report_archives(report_path):
+    """
+    Returns {archive: names of its packages} from the scan report of an earlier run over
+    archives, and the archive of the report's last line. Packages are written archive by
+    archive, so only that archive can be incomplete after a crash. Lines cut off by a crash
+    are left out, and so are archives that could not be read, so a resumed run tries them again.
+    """
+    archives = {}
+    last = None
+    try:
+        f = open(report_path, 'r', encoding='utf-8')
+    except FileNotFoundError:
+        return archives, last
+    with f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue
+            if "archive" not in entry:
+                continue  # Written by a run over extracted packages
+            last = entry["archive"]
+            if "error" in entry:
+                continue
+            packages = archives.setdefault(last, set())
+            if "flagged" not in entry:
+                packages.add(entry["package"])
+    return archives, last
+
+# Bytes read at a time when hashing files for the package manifest
+HASH_CHUNK_BYTES = 1024 * 1024
+
+def file_hash(fpath):
+    """Returns the SHA-256 of a file's contents. Raises OSError if the file cannot be read."""
+    digest = hashlib.sha256()
+    with open(fpath, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _item_paths(path, from_archives=False):
+    """Returns {path inside the item: file path} for a package directory, or for an archive itself."""
+    if from_archives:
+        return {os.path.basename(path): path}
+    return {rel_path: fpath for rel_path, _, fpath in package_files(path)}
+
+def item_files(path, from_archives=False):
+    """
+    Returns the manifest files of a package directory (of the archive with `from_archives`):
+    {path inside it: [size, modification time in ns, SHA-256]}, None for unreadable files.
+    An archive is hashed here. The files of a package directory are hashed as they are read
+    for the features (see add_manifest_hash), so the hash stays None for files that are not
+    read whole.
+    """
+    return {rel_path: manifest_file(fpath, hashed=from_archives)
+            for rel_path, fpath in _item_paths(path, from_archives).items()}
+
+def manifest_file(fpath, hashed=False):
+    """Returns [size, modification time in ns, SHA-256 if `hashed`] of a file, None if it is unreadable."""
+    try:
+        stat = os.stat(fpath)
+        return [stat.st_size, stat.st_mtime_ns, file_hash(fpath) if hashed else None]
+    except OSError:
+        return None
+
+def add_manifest_hash(manifest, path, record):
+    """Stores the hash read_scan_bytes took of the file at `path` in the manifest files `manifest`, if any."""
+    if manifest is not None and manifest.get(path) is not None and record is not None:
+        manifest[path][2] = record.get("sha256")
+
+def item_unchanged(path, files, from_archives=False):
+    """
+    Tells whether a package directory (an archive with `from_archives`) still holds the
+    manifest `files`: the same paths and sizes, and the same modification times or else the
+    same contents. Only files whose time changed are hashed; their new times are stored in
+    `files`. A changed time counts as a change for files that were not hashed.
+    """
+    paths = _item_paths(path, from_archives)
+    if paths.keys() != files.keys():
+        return False
+    touched = []
+    for rel_path, fpath in paths.items():
+        try:
+            stat = os.stat(fpath)
+        except OSError:
+            if files[rel_path] is not None:
+                return False
+            continue
+        if files[rel_path] is None or stat.st_size != files[rel_path][0]:
+            return False
+        if stat.st_mtime_ns != files[rel_path][1]:
+            if files[rel_path][2] is None:
+                return False
+            touched.append((rel_path, fpath, stat.st_mtime_ns))
+    for rel_path, fpath, mtime in touched:
+        try:
+            if file_hash(fpath) != files[rel_path][2]:
+                return False
+        except OSError:
+            return False
+    for rel_path, _, mtime in touched:
+        files[rel_path][1] = mtime
+    return True
+
+def manifest_settings(config, tokens):
+    """
+    Returns a fingerprint of everything besides the files that the rows depend on: the
+    feature versions, the file order, the tokens, the columns, the statistics mode, the
+    file policy, the budget and the archive limits. A manifest written with other settings
+    is not reused.
+    """
+    settings = [FEATURE_VERSION, FILE_ORDER_VERSION, {name: family["version"] for name, family in FEATURE_FAMILIES.items()}, tokens,
+                config["columns"], config["exact_stats"], config["file_policy"], config["budget"],
+                config["archive_limits"]]
+    return hashlib.sha256(json.dumps(settings).encode('utf-8')).hexdigest()[:16]
+
+def read_manifest(manifest_path, settings):
+    """
+    Returns {item: manifest entry} from the package manifest of earlier runs, including the
+    entries an interrupted run left in its temporary file. A manifest written with other
+    `settings` (see manifest_settings) is ignored.
+    """
+    entries = {}
+    for path in (manifest_path, manifest_path + ".tmp"):  # The interrupted run is the newer one
+        try:
+            f = open(path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            continue
+        with f:
+            try:
+                header = json.loads(f.readline())
+            except ValueError:
+                header = None
+            if not isinstance(header, dict) or header.get("settings") != settings:
+                print(f"Not reusing {path}: it was written with other settings")
+                continue
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Cut off by a crash
+                entries[entry["item"]] = entry
+    return entries
+
+# Per-file counts in the per-file table; the entropy histograms are stored as JSON text,
+# which keeps the int 0 of empty strings apart from 0.0 like the package statistics do
+FILE_TABLE_COUNTS = SUMMED_COUNTS + ("brackets", "equals", "pluses", "install_patterns", "dangerous")
+FILE_TABLE_ROW_GROUP = 100000  # Rows buffered per Parquet row group
+
+def file_table_schema():
+    """Returns the Arrow schema of the per-file table, tagged with the FEATURE_VERSION."""
+    return pa.schema(
+        [("package", pa.string()), ("path", pa.string()), ("file", pa.string()),
+         ("bytes", pa.int64()), ("scanned_bytes", pa.int64()), ("binary", pa.bool_()), ("analyzed", pa.bool_()),
+         ("sampling", pa.string())]
+        + [(key, pa.int64()) for key in FILE_TABLE_COUNTS]
+        + [("identifier_entropies", pa.string()), ("string_entropies", pa.string())],
+        metadata={"feature_version": str(FEATURE_VERSION)})
+
+def new_file_table_part(table_dir):
+    """Returns the path for the next Parquet part of a per-file table directory."""
+    os.makedirs(table_dir, exist_ok=True)
+    index = 0
+    while os.path.exists(os.path.join(table_dir, f"files-{index:04d}.parquet")):
+        index += 1
+    return os.path.join(table_dir, f"files-{index:04d}.parquet")
+
+def file_table_rows(result):
+    """
+    Converts the files kept in a package_result to per-file table rows, in walk order.
+    A package without files gets one row without a path, so it is not lost.
+    """
+    rows = []
+    for path, fname, features, record in result["files"]:
+        row = {
+            "package": result["package"], "path": path, "file": fname,
+            "bytes": None if record is None else record["bytes"],
+            "scanned_bytes": None if record is None else record["scanned_bytes"],
+            "binary": None if record is None else record["binary"],
+            "analyzed": features is not None,
+            "sampling": None if record is None else record.get("sampling"),
+        }
+        # Families not computed in this run stay empty
+        for key in FILE_TABLE_COUNTS:
+            row[key] = None if features is None else features.get(key)
+        for key in ("identifier_entropies", "string_entropies"):
+            row[key] = None if features is None or key not in features else json.dumps(features[key])
+        rows.append(row)
+    return rows or [{"package": result["package"]}]
+
+def read_file_table(table_dir):
+    """
+    Yields (package, [(file name, scan_file results or None, record or None), ...]) from a
+    per-file table directory, files in walk order (see walk_order), also for parts written
+    before both extraction modes used that order. The record holds the file's "bytes" and
+    "sampling" (see add_sampling), and is None for unreadable files. A package written by
+    several runs (see `resume`) is taken from the last one.
+    """
+    if pq is None:
+        raise ImportError("Reading the per-file table needs pyarrow")
+    parts = sorted(os.path.join(table_dir, name) for name in os.listdir(table_dir)
+                   if name.startswith("files-") and name.endswith(".parquet"))
+
+    latest = {}
+    for index, part in enumerate(parts):
+        version = (pq.read_schema(part).metadata or {}).get(b"feature_version", b"").decode()
+        if version != str(FEATURE_VERSION):
+            raise ValueError(f"{part} holds results of feature version {version or '?'}, "
+                             f"not {FEATURE_VERSION}; extract the packages again")
+        for pkg in pq.read_table(part, columns=["package"]).column("package").unique().to_pylist():
+            latest[pkg] = index
+
+    for index, part in enumerate(parts):
+        current = None
+        files = []
+        for batch in pq.ParquetFile(part).iter_batches():
+            for row in batch.to_pylist():
+                if row["package"] != current:
+                    if current is not None and latest[current] == index:
+                        yield current, _in_walk_order(files)
+                    current = row["package"]
+                    files = []
+                if row["path"] is None:
+                    continue  # Package without files
+                features = None
+                if row["analyzed"]:
+                    features = {key: row[key] for key in FILE_TABLE_COUNTS if row[key] is not None}
+                    for key in ("identifier_entropies", "string_entropies"):
+                        if row[key] is not None:
+                            features[key] = json.loads(row[key])
+                record = None
+                if row["bytes"] is not None:
+                    record = {"bytes": row["bytes"], "sampling": row.get("sampling")}  # Parts written before budgets lack it
+                files.append((row["path"], row["file"], features, record))
+        if current is not None and latest[current] == index:
+            yield current, _in_walk_order(files)
+
+def _in_walk_order(files):
+    """Sorts (path, file name, features, record) tuples in walk order and drops the paths."""
+    return [file[1:] for file in sorted(files, key=lambda file: walk_order(file[0]))]
+
+def reaggregate_file_table(table_dir, csv_path, exact_stats=True, columns=None, flag_approximate=False):
+    """
+    Rebuilds a dataset CSV (with the given `columns`, see select_columns) from the
+    per-file table of earlier runs without reading any package, so changed or added
+    package aggregates (package_row) only cost a pass over the table. The rows match
+    those of the runs that wrote the table; pass `flag_approximate` for runs with a
+    package budget. Raises ValueError if the table lacks results the columns need, because
+    those runs computed fewer columns.
+    """
+    columns = select_columns(columns, flag_approximate)
+    keys = family_keys(select_families(columns))
+    with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(columns)
+        for pkg, files in read_file_table(table_dir):
+            package = new_package_features(exact_stats)
+            for fname, features, record in files:
+                missing = [] if features is None else [key for key in keys if key not in features]
+                if missing:
+                    raise ValueError(f"The file table has no {', '.join(missing)} results for {pkg}; "
+                                     "extract the packages with these columns first")
+                add_file_features(package, fname, features)
+                add_sampling(package, features, record)
+            extrapolate_counts(package)
+            writer.writerow(package_row(pkg, package, columns))
+    print("Results saved to", csv_path)
+
+def profile_summary(profile_path, top=10):
+    """
+    Summarizes a profile written by record_setup_info_to_csv: the `top` slowest packages,
+    and the time, files, bytes and throughput of every extractor over all packages.
+    Returns the report as text.
+    """
+    packages = []
+    extractors = {}
+    prefetch = {"packages": 0, "read_seconds": 0.0, "wait_seconds": 0.0, "mean_ready": 0.0}
+    with open(profile_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            slowest = max(entry["extractors"], key=lambda name: entry["extractors"][name]["wall"], default="-")
+            packages.append((entry["wall"], entry["cpu"], entry["files"], entry["bytes"], entry["peak_memory"],
+                             slowest, entry["package"]))
+            for name, stats in entry["extractors"].items():
+                total = extractors.setdefault(name, new_extractor_stats())
+                for key in total:
+                    total[key] += stats[key]
+            if entry.get("prefetch") is not None:
+                prefetch["packages"] += 1
+                for key in ("read_seconds", "wait_seconds", "mean_ready"):
+                    prefetch[key] += entry["prefetch"][key]
+
+    mb = 1024 * 1024
+    wall = sum(package[0] for package in packages)
+    lines = [f"Profile of {len(packages)} packages: {wall:.1f} s wall, {sum(package[1] for package in packages):.1f} s CPU, "
+             f"{sum(package[2] for package in packages)} files, {sum(package[3] for package in packages) / mb:.1f} MB read",
+             "",
+             f"Slowest {min(top, len(packages))} packages:",
+             f"{'wall s':>10} {'cpu s':>10} {'files':>8} {'MB read':>10} {'peak MB':>9}  {'slowest extractor':<20} package"]
+    for package_wall, cpu, files, nbytes, peak, slowest, pkg in heapq.nlargest(top, packages, key=lambda package: package[0]):
+        peak = "-" if peak is None else f"{peak / mb:.1f}"
+        lines.append(f"{package_wall:>10.3f} {cpu:>10.3f} {files:>8} {nbytes / mb:>10.1f} {peak:>9}  {slowest:<20} {pkg}")
+    lines += ["",
+              "Extractors:",
+              f"{'extractor':<20} {'wall s':>10} {'share':>7} {'cpu s':>10} {'files':>9} {'MB':>10} {'MB/s':>9}"]
+    for name, stats in sorted(extractors.items(), key=lambda item: item[1]["wall"], reverse=True):
+        share = stats["wall"] / wall if wall else 0.0
+        throughput = stats["bytes"] / mb / stats["wall"] if stats["wall"] else 0.0
+        lines.append(f"{name:<20} {stats['wall']:>10.3f} {share:>7.1%} {stats['cpu']:>10.3f} {stats['files']:>9} "
+                     f"{stats['bytes'] / mb:>10.1f} {throughput:>9.1f}")
+    if prefetch["packages"]:
+        lines += ["",
+                  f"Read-ahead: {prefetch['read_seconds']:.1f} s reading on I/O threads, {prefetch['wait_seconds']:.1f} s "
+                  f"waiting for reads, {prefetch['mean_ready'] / prefetch['packages']:.1f} reads ready per file taken "
+                  f"(mean of packages)"]
+    return "\n".join(lines) + "\n"
+
+async def record_setup_info_to_csv(directory, csv_path, token_file, workers=None, resume=False, cache_dir=None,
+                                   from_archives=False, exact_stats=True, policy=None, report_path=None,
+                                   file_table_dir=None, columns=None, budget=None, profile_path=None,
+                                   trace_memory=False, manifest_path=None, read_threads=0, archive_limits=None):
+    """
+    Gathers statistics for each package (top-level directory) inside 'directory'
+    by aggregating data over the entire directory tree. For each package, a single row
+    is written to the CSV with metrics such as total lines, total words, etc.
+    Set `workers` to process packages in that many parallel processes; the rows are
+    written in the same order as a serial run.
+    Rows are flushed to the CSV as each package finishes. With `resume`, an existing CSV
+    is kept and only packages that are not in it yet are processed and appended. With
+    `from_archives`, the archives whose packages are all written are only skipped with a
+    `report_path`, whose lines name the archive of every package (see read_report_archives).
+    With `cache_dir`, per-file results are cached there by content hash and reused across
+    packages and runs.
+    With `from_archives`, 'directory' holds the downloaded archives instead of the extracted
+    packages, and the features are read straight out of the archives without extracting them.
+    With `exact_stats` False, the mean/std dev/max/Q3 columns are computed in bounded memory
+    per package, with an approximate Q3 (see RunningStats).
+    `policy` decides which part of binary and oversized files is analyzed (see
+    DEFAULT_FILE_POLICY). With `report_path`, a JSON line per package is written there with
+    its file and byte counts, including how many bytes the policy skipped.
+    With `file_table_dir`, every file's results are also written to a Parquet part in
+    that directory (a new part per run), from which reaggregate_file_table rebuilds the
+    CSV without rescanning. This needs pyarrow.
+    With `columns`, only those CSV columns are written and only the feature families they
+    need are computed (see select_columns and FEATURE_FAMILIES).
+    With `budget`, packages that take more time or bytes than its limits are sampled and
+    their counts extrapolated (see DEFAULT_BUDGET); such rows have a 1 in the added
+    Approximate column.
+    With `profile_path`, the wall time, CPU time, files and bytes of every extractor on
+    every package are written there as JSON lines (see PackageProfile), with each package's
+    peak memory if `trace_memory` is set. A report of the slowest packages and extractors
+    is printed at the end and written next to it (see profile_summary).
+    With `manifest_path`, the files (size, modification time and content hash) and the rows
+    of every package are kept in a manifest there. A rerun then only extracts the packages
+    that are new or changed, and rewrites the CSV with the other rows taken from the
+    manifest, in the order of a full run. A run that is interrupted is continued by the
+    next one, so `resume` is not needed with a manifest. Packages that are no longer in
+    'directory' are dropped. The per-file table only gets parts for extracted packages,
+    which reaggregate_file_table combines with the earlier parts.
+    With `read_threads`, every extracting process reads files ahead of the analysis on that
+    many I/O threads (see read_files), for slow or network storage. The profile then shows
+    how long the analysis waited for reads and how full the read-ahead was.
+    With `from_archives`, archives that unpack to more than `archive_limits` allow (see
+    DEFAULT_ARCHIVE_LIMITS) are aborted and flagged in the report instead of written.
+    """
+    if file_table_dir is not None and pq is None:
+        raise ImportError("Writing the per-file table needs pyarrow")
+    if resume and manifest_path is not None:
+        raise ValueError("A run with a manifest continues an interrupted one by itself; do not set resume")
+    with open(token_file, 'r', encoding='utf-8') as f:
+        tokens = line_tokens(json.load(f))
+    config = extraction_config(tokens, cache_dir, exact_stats, policy, keep_files=file_table_dir is not None,
+                               columns=columns, budget=budget, profile=profile_path is not None,
+                               trace_memory=trace_memory, manifest=manifest_path is not None,
+                               read_threads=read_threads, limits=archive_limits)
+
+    written = None
+    if resume and os.path.exists(csv_path):
+        written = read_written_packages(csv_path, config["columns"])
+
+    if from_archives:
+        # Each archive holds one or more packages; their names are only known once it is read
+        packages = [name for name in os.listdir(directory) if os.path.isfile(os.path.join(directory, name))]
+        if written and report_path is not None:
+            # The report of the earlier run tells which packages came from which archive
+            archives, last = read_report_archives(report_path)
+            packages = [name for name in packages
+                        if not (name in archives and name != last and archives[name] <= written)]
+    else:
+        # Each top-level directory is one unzipped package
+        packages = [pkg for pkg in os.listdir(directory)
+                    if os.path.isdir(os.path.join(directory, pkg)) and not pkg.startswith(STAGING_PREFIX)
+                    and not (written and pkg in written)]
+    if written:
+        print(f"Resuming {csv_path}: {len(written)} packages already written, {len(packages)} left")
+
+    unchanged = {}
+    if manifest_path is not None:
+        settings = manifest_settings(config, tokens)
+        manifest = read_manifest(manifest_path, settings)
+        for item in packages:
+            if item in manifest and item_unchanged(os.path.join(directory, item), manifest[item]["files"], from_archives):
+                unchanged[item] = manifest[item]
+        print(f"Manifest {manifest_path}: {len(unchanged)} packages unchanged, {len(packages) - len(unchanged)} to extract")
+
+    mode = 'w' if written is None else 'a'
+    with open(csv_path, mode, newline='', encoding='utf-8') as csvfile, \
+            open(report_path or os.devnull, mode, encoding='utf-8') as reportfile, \
+            open(profile_path or os.devnull, mode, encoding='utf-8') as profilefile, \
+            open(os.devnull if manifest_path is None else manifest_path + ".tmp", 'w', encoding='utf-8') as manifestfile, \
+            (contextlib.nullcontext() if file_table_dir is None else
+             pq.ParquetWriter(new_file_table_part(file_table_dir), file_table_schema())) as table:
+        writer = csv.writer(csvfile)
+        if written is None:
+            writer.writerow(config["columns"])
+        if manifest_path is not None:
+            manifestfile.write(json.dumps({"settings": settings}) + "\n")
+
+        table_rows = []
+        extracted = extract_packages(directory, [item for item in packages if item not in unchanged],
+                                     config, workers, from_archives)
+        try:
+            for item in packages:
+                entry = unchanged[item] if item in unchanged else await anext(extracted)
+                if entry["flagged"] is not None:
+                    reportfile.write(json.dumps({"package": item, "archive": item, "flagged": entry["flagged"]}) + "\n")
+                    reportfile.flush()
+                if entry.get("error") is not None:
+                    reportfile.write(json.dumps({"package": item, "archive": item, "error": entry["error"]}) + "\n")
+                    reportfile.flush()
+                for result in entry["results"]:
+                    row = result["row"]
+                    if written and row[0] in written:
+                        continue
+                    writer.writerow(row)
+                    csvfile.flush()
+                    report = dict(result["report"], archive=item) if from_archives else result["report"]
+                    reportfile.write(json.dumps(report) + "\n")
+                    reportfile.flush()
+                    if item in unchanged:
+                        continue
+                    if result["profile"] is not None:
+                        profilefile.write(json.dumps(result["profile"]) + "\n")
+                        profilefile.flush()
+                    if table is not None:
+                        table_rows.extend(file_table_rows(result))
+                        if len(table_rows) >= FILE_TABLE_ROW_GROUP:
+                            table.write_table(pa.Table.from_pylist(table_rows, schema=file_table_schema()))
+                            table_rows = []
+                    print("Processed", row[0])
+                if manifest_path is not None and entry.get("error") is None:  # Unreadable archives are tried again
+                    results = [{"row": result["row"], "report": result["report"]} for result in entry["results"]]
+                    manifestfile.write(json.dumps({"item": item, "files": entry["files"], "results": results,
+                                                   "flagged": entry["flagged"]}) + "\n")
+                    manifestfile.flush()
+        finally:
+            await extracted.aclose()  # Shuts the worker processes down on errors and interrupts too
+            # Also on errors and interrupts, so the part stays readable with every row written so far
+            if table_rows:
+                table.write_table(pa.Table.from_pylist(table_rows, schema=file_table_schema()))
+
+    if manifest_path is not None:
+        os.replace(manifest_path + ".tmp", manifest_path)  # Only after a complete run
+    print("Results saved to", csv_path)
+    if profile_path is not None:
+        summary = profile_summary(profile_path)
+        with open(os.path.splitext(profile_path)[0] + "_summary.txt", 'w', encoding='utf-8') as f:
+            f.write(summary)
+        print(summary)
+
+if __name__ == "__main__":
+    startime = datetime.datetime.now()
+    source_dir = r"C:\\Users\\Mikael Laptop\\MaliciousPackages"
+    output_dir = r"C:\\Users\\Mikael Laptop\\Extraction\\ExtractedMaliciousPackages"
+    token_file = r"C:\\Users\\Mikael Laptop\\Extraction\\dangerous_tokens.json"
+    csv_output_path = os.path.join(output_dir, "dataset.csv")
+    workers = os.cpu_count()  # Worker processes for feature extraction, 1 for a serial run
+    resume = False  # Continue a previous run by appending to the existing dataset.csv
+    cache_dir = r"C:\\Users\\Mikael Laptop\\Extraction\\feature_cache"  # Per-file results cache, None to disable
+    from_archives = False  # Read the features straight out of the archives in source_dir instead of extracting them
+    exact_stats = True  # False bounds the memory per package, with an approximate Q3
+    policy = None  # File policy, e.g. {"binary": "skip", "oversized": "truncate", "max_bytes": 1024 * 1024}
+    report_path = os.path.join(output_dir, "scan_report.jsonl")  # Per-package file and skipped byte counts
+    file_table_dir = None  # Directory for the per-file table (needs pyarrow), see Reaggregate.py
+    columns = None  # CSV columns to compute, e.g. ["Total Lines", "Total URLs"]; None for all
+    budget = None  # Per-package limits, e.g. {"max_seconds": 60, "max_bytes": 256 * 1024 * 1024}; None for none
+    profile_path = os.path.join(output_dir, "profile.jsonl")  # Time per package and extractor, None to disable
+    trace_memory = False  # Also trace each package's peak memory in the profile, which slows extraction down
+    manifest_path = os.path.join(output_dir, "manifest.jsonl")  # Reruns only extract new or changed packages, None to disable
+    read_threads = 4  # I/O threads per process reading files ahead of the analysis, 0 to read inline
+    limits = None  # Limits per archive, e.g. {"max_bytes": 1024 ** 3, "max_ratio": 100}; None for the defaults
+
+    if from_archives:
+        os.makedirs(output_dir, exist_ok=True)
+        asyncio.run(record_setup_info_to_csv(source_dir, csv_output_path, token_file, workers=workers, resume=resume,
+                                             cache_dir=cache_dir, from_archives=True, exact_stats=exact_stats,
+                                             policy=policy, report_path=report_path, file_table_dir=file_table_dir,
+                                             columns=columns, budget=budget, profile_path=profile_path,
+                                             trace_memory=trace_memory, manifest_path=manifest_path,
+                                             read_threads=read_threads, archive_limits=limits))
+    else:
+        summary = extract_archives(source_dir, output_dir, workers=workers, limits=limits)
+        print(f"Extracted {summary['extracted']} archives, {summary['unchanged']} unchanged since the last run, "
+              f"{summary['failed']} failed, {summary['flagged']} flagged, {summary['skipped']} skipped")
+        for result in summary["archives"]:
+            if result["status"] == "failed":
+                print(f"Could not extract {result['archive']}: {result['error']}")
+            elif result["status"] == "flagged":
+                print(f"Flagged {result['archive']}: {result['error']}")
+        asyncio.run(record_setup_info_to_csv(output_dir, csv_output_path, token_file, workers=workers, resume=resume,
+                                             cache_dir=cache_dir, exact_stats=exact_stats, policy=policy,
+                                             report_path=report_path, file_table_dir=file_table_dir,
+                                             columns=columns, budget=budget, profile_path=profile_path,
+                                             trace_memory=trace_memory, manifest_path=manifest_path,
+                                             read_threads=read_threads))
+    endtime = datetime.datetime.now()
+    print(f"Starttid: {startime} Sluttid: {endtime}")
@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# Reaggregate.py
+# Rebuilds dataset.csv from the per-file table written by FeatureExtraction.py (file_table_dir),
+# without reading the packages again. Run it after changing the package aggregates.
+
+import datetime
+
+from FeatureExtraction import reaggregate_file_table
+
+if __name__ == "__main__":
+    startime = datetime.datetime.now()
+    file_table_dir = r"C:\\Users\\Mikael Laptop\\Extraction\\file_table"
+    csv_output_path = r"C:\\Users\\Mikael Laptop\\Extraction\\ExtractedMaliciousPackages\\dataset.csv"
+    exact_stats = True  # False bounds the memory per package, with an approximate Q3
+    columns = None  # CSV columns to write, None for all
+    flag_approximate = False  # True if the table was written with a package budget
+
+    reaggregate_file_table(file_table_dir, csv_output_path, exact_stats=exact_stats, columns=columns,
+                           flag_approximate=flag_approximate)
+    endtime = datetime.datetime.now()
+    print(f"Starttid: {startime} Sluttid: {endtime}")
@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# ScoringService.py
+# Scores packages as they are published. A long-running process keeps the token matcher,
+# the compiled patterns and a trained model (saved by Training/ExportModel.py) in memory,
+# and answers on a local HTTP endpoint with the feature vector and malicious probability
+# of an archive or an extracted package directory:
+#
+#   POST /score  {"path": "<archive or package directory>"}
+#   GET  /stats  number of requests and their p50/p99 latency
+
+import datetime
+import json
+import os
+import pickle
+import socketserver
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from FeatureExtraction import extract_item, extraction_config, line_tokens
+
+# Latest request latencies the percentiles in /stats are computed over
+LATENCY_WINDOW = 10000
+
+def load_model(model_path):
+    """Loads a model saved by Training/ExportModel.py: a dict with the fitted "model" and its feature "columns"."""
+    with open(model_path, 'rb') as f:
+        return pickle.load(f)
+
+class Scorer:
+    """
+    Extracts the features of archives and package directories and scores them with a model
+    from load_model. The extraction settings are built once, and only the feature families
+    the model's columns need are computed. Archives are read without unpacking them, within
+    the archive `limits` (see DEFAULT_ARCHIVE_LIMITS).
+    """
+
+    def __init__(self, model, tokens, cache_dir=None, policy=None, limits=None):
+        self.model = model["model"]
+        self.columns = model["columns"]
+        self.config = extraction_config(tokens, cache_dir, policy=policy, columns=self.columns, limits=limits)
+        # Rows follow CSV_HEADER order; the model takes its columns in the order it was fitted with
+        self.indices = [self.config["columns"].index(column) for column in self.columns]
+        self.malicious = list(self.model.classes_).index(1)
+        # The first prediction is slower, so it is made before the first request
+        self.probabilities([[0] * len(self.config["columns"])])
+
+    def vectors(self, rows):
+        """Returns the feature vectors of rows from package_row as a float array, in the model's column order."""
+        return np.array([[row[index] for index in self.indices] for row in rows], dtype=float).reshape(-1, len(self.indices))
+
+    def probabilities(self, rows):
+        """Returns the malicious probability of every row from package_row, predicted as one batch."""
+        if not rows:
+            return np.zeros(0)
+        return self.model.predict_proba(self.vectors(rows))[:, self.malicious]
+
+    def score(self, path):
+        """
+        Scores every package in `path`, an archive or a package directory. Returns a dict with
+        the "item" name, the limit it went over if the archive was "flagged", the read
+        "error" of an archive that could not be read (see extract_item), and the "packages"
+        with their feature vector and probability.
+        """
+        item = extract_item(path, self.config, from_archives=os.path.isfile(path))
+        rows = [result["row"] for result in item["results"]]
+        packages = [{"package": row[0], "features": dict(zip(self.columns, vector.tolist())), "probability": float(p)}
+                    for row, vector, p in zip(rows, self.vectors(rows), self.probabilities(rows))]
+        return {"item": item["item"], "flagged": item["flagged"], "error": item["error"], "packages": packages}
+
+class LatencyStats:
+    """Keeps the latencies of the latest `window` requests, for their percentiles."""
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.latencies.append(seconds)
+            self.requests += 1
+
+    def summary(self):
+        """Returns the number of requests and the p50, p99 and max latency in ms of the latest ones."""
+        with self.lock:
+            latencies = np.array(self.latencies)
+            requests = self.requests
+        if not len(latencies):
+            return {"requests": requests, "p50_ms": None, "p99_ms": None, "max_ms": None}
+        p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+        return {"requests": requests, "p50_ms": round(p50, 1), "p99_ms": round(p99, 1),
+                "max_ms": round(latencies.max() * 1000, 1)}
+
+class ScoringHandler(BaseHTTPRequestHandler):
+    """Answers /score and /stats for the Scorer and LatencyStats of its server."""
+
+    def send_json(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path != "/stats":
+            self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        self.send_json(200, self.server.stats.summary())
+
+    def do_POST(self):
+        if self.path != "/score":
+            self.send_json(404, {"error": f"Unknown endpoint {self.path}"})
+            return
+        start = time.perf_counter()
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            path = request["path"]
+            if not isinstance(path, str):
+                raise TypeError("path must be a string")  # os.path.exists takes an int as a file descriptor
+        except (ValueError, KeyError, TypeError):
+            self.send_json(400, {"error": 'Expected a JSON body with the "path" to score'})
+            return
+        if not os.path.exists(path):
+            self.send_json(404, {"error": f"No such archive or package: {path}"})
+            return
+        try:
+            result = self.server.scorer.score(path)
+        except (OSError, ValueError) as e:
+            self.send_json(500, {"error": str(e)})
+            return
+        if result["error"] is not None:
+            self.send_json(422, {"error": f"Could not read {result['item']}: {result['error']}"})
+            return
+        seconds = time.perf_counter() - start
+        self.server.stats.add(seconds)
+        result["seconds"] = seconds
+        self.send_json(200, result)
+        if result["flagged"] is not None:
+            scores = f"flagged, {result['flagged']}"
+        else:
+            scores = ", ".join(f"{package['package']} {package['probability']:.3f}" for package in result["packages"])
+        print(f"Scored {result['item']} in {seconds * 1000:.0f} ms: {scores}")
+
+    def log_message(self, format, *args):
+        pass  # Every scored request is printed by do_POST
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """An HTTP server on a Unix socket, for platforms that have them."""
+        daemon_threads = True
+
+def serve(scorer, host="127.0.0.1", port=8765, socket_path=None):
+    """
+    Serves `scorer` on `host`:`port`, or on the Unix socket `socket_path`, until interrupted.
+    Requests are handled in threads, so /stats answers while a package is being scored.
+    Prints the latency summary on shutdown.
+    """
+    if socket_path is None:
+        server = ThreadingHTTPServer((host, port), ScoringHandler)
+        print(f"Scoring on http://{host}:{port}")
+    else:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        server = UnixHTTPServer(socket_path, ScoringHandler)
+        print(f"Scoring on {socket_path}")
+    server.scorer = scorer
+    server.stats = LatencyStats()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("Latency:", server.stats.summary())
+
+if __name__ == "__main__":
+    startime = datetime.datetime.now()
+    model_path = r"C:\\Users\\Mikael Laptop\\Extraction\\model.pkl"  # Saved by Training/ExportModel.py
+    token_file = r"C:\\Users\\Mikael Laptop\\Extraction\\dangerous_tokens.json"
+    host, port = "127.0.0.1", 8765
+    socket_path = None  # Unix socket to listen on instead of host and port, where the platform has them
+    cache_dir = None  # Per-file results cache shared with FeatureExtraction.py, None to disable
+    limits = None  # Limits per archive, e.g. {"max_bytes": 1024 ** 3}; None for the defaults
+
+    with open(token_file, 'r', encoding='utf-8') as f:
+        tokens = line_tokens(json.load(f))
+    scorer = Scorer(load_model(model_path), tokens, cache_dir=cache_dir, limits=limits)
+    print(f"Model loaded in {(datetime.datetime.now() - startime).total_seconds():.1f} s")
+    serve(scorer, host, port, socket_path)
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# test_golden_row.py
+# Checks the single-pass engine against the original per-extractor functions. The functions
+# below are the extractors FeatureExtraction.py started from (separate findall calls over a
+# text-mode read, statistics for the package statistics), kept as they were apart from the
+# file order, so a change to the memos, the fused regex or RunningStats cannot change the rows
+# without notice. Run with `python -m unittest test_golden_row` from this directory.
+
+import base64
+import json
+import math
+import os
+import re
+import shutil
+import statistics
+import tempfile
+import unittest
+from unittest import mock
+
+import FeatureExtraction as fe
+from Benchmark import DEFAULT_SPEC, generate_package
+
+TOKEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dangerous_tokens.json")
+
+# A small generated package, with setup files, binaries and a minified bundle
+SPEC = dict(DEFAULT_SPEC, py_files=3, py_lines=80, setup_files=3, binary_files=2, binary_bytes=2048,
+            js_blobs=1, js_bytes=4096, base64_strings=3, links=3)
+
+# Files added to the generated package for what the generator does not cover
+EXTRA_FILES = {
+    # Windows line endings, and a line without one at the end
+    "crlf/module.py": b'import os\r\nurl = "https://example.com/a b"\r\nips = [\'10.0.0.1\', "192.168.1.254"]\r\n'
+                      b'x = y + z  # [1] == [2]\r\nsubprocess.run(["ls"])',
+    # Non-ASCII identifiers and strings, and bytes that are not UTF-8
+    "unicode/strings.py": 'café = "naïve 日本語 ✓"\nname = \'Ångström\'\n'
+                          'blob = "aGVsbG8gd29ybGQ="\n'.encode('utf-8') + b'bad = "\xff\xfe\x00 rest"\n',
+    # Setup files without identifiers or strings take the last entropy of the file before
+    # them into the setup string entropies
+    "zz_empty/__init__.py": b"",
+    "zz_empty/setup.py": b"# 1 + 2 == 3\n",
+    "zz_last/__init__.pyi": b"value: 'typed' = 'aa'\n",
+}
+
+SETUP_FILES = {"setup.py", "__init__.py", "__init__.pyi", "__init__"}
+identifier_pattern = re.compile(r'\b[a-zA-Z_][a-zA-Z0-9_]*\b')
+string_pattern = re.compile(r'["\'](.*?)["\']')
+ip_pattern = re.compile(r'\b(?:[0-9]{1,3}\.){3}[0-9]{1,3}\b')
+url_pattern = re.compile(r'https?://\S+')
+install_pattern = re.compile(
+    r'\b(?:'
+    r'exec\s*\(\s*open\s*\('
+    r'|subprocess\.run\s*\('
+    r'|subprocess\.call\s*\('
+    r'|\[\s*[\'"]pip[\'"]\s*,\s*[\'"]install[\'"]'
+    r'|\[\s*[\'"]pip[\'"]\s*,\s*[\'"]download[\'"]'
+    r'|python\s+setup\.py\s+install'
+    r'|\[\s*[\'"]python[\'"]\s*,\s*[\'"]setup\.py[\'"]\s*,\s*[\'"]install[\'"]'
+    r'|entry_points\s*='
+    r'|scripts\s*='
+    r')\b',
+    re.IGNORECASE
+)
+dangerous_pattern = re.compile(
+    r'\b(?:chmod\s+\+x|rm\s+-rf\s+/|apt-get\s+install|yum\s+install|brew\s+install|Makefile\s+install:|sudo\s+make\s+install|wget\s+http://|socat\s+exec:)\b',
+    re.IGNORECASE
+)
+
+def walk_files(directory):
+    """Yields (file name, file path) in the order the engine visits them (see package_files)."""
+    for dirpath, dirnames, subfiles in os.walk(directory):
+        dirnames.sort()
+        for fname in sorted(subfiles):
+            yield fname, os.path.join(dirpath, fname)
+
+def read(fpath):
+    with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
+        return f.read()
+
+def read_lines(fpath):
+    with open(fpath, 'r', encoding='utf-8', errors='ignore') as f:
+        return list(f)
+
+def generalize_text(text):
+    return ''.join('a' if c.isalpha() else '1' if c.isdigit() else c for c in text)
+
+def entropy(text):
+    if not text:
+        return 0
+    freq = {}
+    for char in text:
+        freq[char] = freq.get(char, 0) + 1
+    result = 0
+    for count in freq.values():
+        probability = count / len(text)
+        result -= probability * math.log2(probability)
+    return result
+
+def is_base64_encoded(s):
+    try:
+        return base64.b64encode(base64.b64decode(s, validate=True)).decode('utf-8') == s
+    except Exception:
+        return False
+
+def stats(values):
+    """Mean, standard deviation, max and Q3 as the original extractors computed them."""
+    if not values:
+        return [0, 0, 0, 0]
+    return [statistics.mean(values), statistics.stdev(values) if len(values) > 1 else 0, max(values),
+            statistics.quantiles(values, n=4)[2] if len(values) >= 4 else max(values)]
+
+def reference_row(pkg_path, tokens):
+    """The CSV row of the original record_setup_info_to_csv for one package directory."""
+    total = dict.fromkeys(("lines", "words", "tokens", "urls", "base64", "ips"), 0)
+    setup = dict(total)
+    brackets, equals, pluses = [], [], []
+    identifier_entropies, string_entropies = [], []
+    setup_identifier_entropies, setup_string_entropies = [], []
+    homogeneity = {"identifiers": [0, 0], "strings": [0, 0]}
+    setup_homogeneity = {"identifiers": [0, 0], "strings": [0, 0]}
+    install = dangerous = 0
+    file_counts = dict.fromkeys(fe.FILE_TYPES, 0)
+    entropy_value = None  # Carried over between files, as in compute_entropy_by_category
+
+    for fname, fpath in walk_files(pkg_path):
+        is_setup = fname in SETUP_FILES
+        ext = fname.split('.')[-1].lower()
+        if ext in file_counts:
+            file_counts[ext] += 1
+
+        for line in read_lines(fpath):
+            counts = {"lines": 1, "words": len(line.split()), "tokens": sum(line.count(token) for token in tokens),
+                      "urls": len(url_pattern.findall(line)), "ips": len(ip_pattern.findall(line))}
+            for key, count in counts.items():
+                total[key] += count
+                if is_setup:
+                    setup[key] += count
+
+        content = read(fpath)
+        brackets.append(content.count('[') + content.count(']'))
+        equals.append(content.count('='))
+        pluses.append(content.count('+'))
+        identifiers = identifier_pattern.findall(content)
+        strings = string_pattern.findall(content)
+        for identifier in identifiers:
+            entropy_value = entropy(identifier)
+            identifier_entropies.append(entropy_value)
+            if is_setup:
+                setup_identifier_entropies.append(entropy_value)
+        for string in strings:
+            entropy_value = entropy(string)
+            string_entropies.append(entropy_value)
+        if is_setup and entropy_value is not None:
+            setup_string_entropies.append(entropy_value)
+        for kind, items in (("identifiers", identifiers), ("strings", strings)):
+            for item in items:
+                index = 0 if len(set(generalize_text(item))) == 1 else 1
+                homogeneity[kind][index] += 1
+                if is_setup:
+                    setup_homogeneity[kind][index] += 1
+        found_base64 = sum(1 for s in strings if is_base64_encoded(s.strip()))
+        total["base64"] += found_base64
+        if is_setup:
+            setup["base64"] += found_base64
+        if fname.endswith(".py"):
+            install += len(install_pattern.findall(content))
+        dangerous += len(dangerous_pattern.findall(content))
+
+    columns = ("lines", "words", "tokens", "urls", "base64", "ips")
+    return ([os.path.basename(pkg_path)] + [total[key] for key in columns]
+            + stats(brackets) + stats(equals) + stats(pluses)
+            + stats(identifier_entropies) + stats(string_entropies)
+            + homogeneity["identifiers"] + homogeneity["strings"]
+            + [setup[key] for key in columns]
+            + stats(setup_identifier_entropies) + stats(setup_string_entropies)
+            + setup_homogeneity["identifiers"] + setup_homogeneity["strings"]
+            + [install, dangerous] + list(file_counts.values()))
+
+class GoldenRowTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.mkdtemp()
+        cls.pkg_path = os.path.join(cls.tmp, "golden-1.0")
+        generate_package(cls.pkg_path, SPEC, seed=1)
+        for path, data in EXTRA_FILES.items():
+            fpath = os.path.join(cls.pkg_path, *path.split('/'))
+            os.makedirs(os.path.dirname(fpath), exist_ok=True)
+            with open(fpath, 'wb') as f:
+                f.write(data)
+        with open(TOKEN_FILE, 'r', encoding='utf-8') as f:
+            cls.tokens = json.load(f)
+        cls.expected = reference_row(cls.pkg_path, cls.tokens)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def assertRowsEqual(self, row):
+        self.assertEqual(len(row), len(self.expected))
+        for column, value, expected in zip(fe.CSV_HEADER, row, self.expected):
+            with self.subTest(column=column):
+                if isinstance(expected, float) or isinstance(value, float):
+                    self.assertTrue(math.isclose(value, expected, rel_tol=1e-9, abs_tol=1e-12),
+                                    f"{value} != {expected}")
+                else:
+                    self.assertEqual(value, expected)
+
+    def extract(self, **config):
+        fe.clear_memos()
+        config = fe.extraction_config(fe.line_tokens(self.tokens), **config)
+        return fe.extract_package_features(self.pkg_path, config)["row"]
+
+    def test_row(self):
+        self.assertRowsEqual(self.extract())
+
+    def test_row_with_read_threads(self):
+        self.assertRowsEqual(self.extract(read_threads=2))
+
+    def test_row_scanned_as_bytes(self):
+        # Every plain ASCII file goes through scan_plain_ascii instead of being decoded
+        with mock.patch.object(fe, "MMAP_MIN_BYTES", 1):
+            self.assertRowsEqual(self.extract())
+
+    def test_row_from_archive(self):
+        archive = shutil.make_archive(os.path.join(self.tmp, "golden-1.0"), "gztar", self.tmp, "golden-1.0")
+        try:
+            config = fe.extraction_config(fe.line_tokens(self.tokens))
+            results = fe.extract_archive_features(archive, config)
+        finally:
+            os.remove(archive)
+        self.assertEqual(len(results), 1)
+        self.assertRowsEqual(results[0]["row"])
+
+if __name__ == "__main__":
+    unittest.main()
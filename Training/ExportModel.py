@@ -0,0 +1,47 @@
+import pickle
+import pandas as pd
+from sklearn.model_selection import GridSearchCV
+from sklearn.ensemble import RandomForestClassifier
+
+# Trains the random forest on every feature of dataset.xlsx and saves it for
+# FeatureExtraction/ScoringService.py. The hyperparameters are picked with the same
+# grid search as TrainingRF.py; the final model is fitted on the whole dataset.
+
+features = [
+    "Total Lines", "Total Words", "Total Tokens", "Total URLs", "Total Base64", "Total IPs",
+    "Bracket Mean", "Bracket Std Dev", "Bracket Max", "Bracket Q3",
+    "Equal Mean", "Equal Std Dev", "Equal Max", "Equal Q3",
+    "Plus Mean", "Plus Std Dev", "Plus Max", "Plus Q3",
+    "Identifier Entropy Mean", "Identifier Entropy Std Dev", "Identifier Entropy Max", "Identifier Entropy Q3",
+    "String Entropy Mean", "String Entropy Std Dev", "String Entropy Max", "String Entropy Q3",
+    "Homogeneous Identifiers", "Heterogeneous Identifiers", "Homogeneous Strings", "Heterogeneous Strings",
+    "Setup Total Lines", "Setup Total Words", "Setup Total Tokens", "Setup Total URLs", "Setup Total Base64", "Setup Total IPs",
+    "Setup Identifier Entropy Mean", "Setup Identifier Entropy Std Dev", "Setup Identifier Entropy Max", "Setup Identifier Entropy Q3",
+    "Setup String Entropy Mean", "Setup String Entropy Std Dev", "Setup String Entropy Max", "Setup String Entropy Q3",
+    "Setup Homogeneous Identifiers", "Setup Heterogeneous Identifiers", "Setup Homogeneous Strings", "Setup Heterogeneous Strings",
+    "Total Install Script in .py", "Total Dangerous Install Commands Count"
+]
+model_filename = "model.pkl"
+
+df = pd.read_excel("dataset.xlsx", usecols=features + ["Classification"])
+# Fitted on plain arrays in this column order, the order the scoring service passes them in
+X = df[features].to_numpy(dtype=float)
+y = df["Classification"].to_numpy()
+
+param_grid = {
+    'max_depth':[3, 4, 5, 6,],
+    'n_estimators':[100, 150, 200, 250],
+    'min_samples_split':[6, 11, 16],
+    'min_samples_leaf':[4, 6, 8],
+    'criterion':('gini', 'log_loss', 'entropy'),
+}
+grid_search = GridSearchCV(estimator=RandomForestClassifier(random_state=0), param_grid=param_grid, cv=5, n_jobs=-1)
+grid_search.fit(X, y)
+print("Best parameters:", grid_search.best_params_)
+
+model = RandomForestClassifier(random_state=0, **grid_search.best_params_)
+model.fit(X, y)
+
+with open(model_filename, "wb") as f:
+    pickle.dump({"model": model, "columns": features}, f)
+print(f"Model saved to {model_filename}")